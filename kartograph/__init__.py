@@ -2,5 +2,6 @@
 from kartograph import Kartograph
 from kartograph import verbose
 from map import projections
+from options import MapOptions
 
-__all__ = ['Kartograph', 'projections', 'verbose']
+__all__ = ['Kartograph', 'MapOptions', 'projections', 'verbose']
@@ -36,6 +36,10 @@ parser.add_argument('--verbose', '-v', nargs='?', metavar='', const=True, help='
 parser.add_argument('--format', '-f', metavar='svg', help='output format, if not specified it will be guessed from output filename or default to svg')
 parser.add_argument('--preview', '-p', nargs='?', metavar='', const=True, help='opens the generated svg for preview')
 parser.add_argument('--pretty-print', '-P', dest='pretty_print', action='store_true', help='pretty print the svg file')
+parser.add_argument('--batch', '-b', action='store_true', help='the config is a list of maps, each with a "config", an "output" and an optional "style"')
+parser.add_argument('--jobs', '-j', metavar='N', type=int, default=1, help='number of processes used for generating maps in batch mode')
+parser.add_argument('--stats', metavar='FILE', type=argparse.FileType('w'), help='writes the time spent in each stage and the size of each layer as JSON')
+parser.add_argument('--trace', metavar='FILE', type=argparse.FileType('w'), help='writes the time spent in each stage in the chrome://tracing format')
 
 from kartograph import Kartograph
 import time
@@ -43,14 +47,11 @@ import os
 
 
 def render_map(args):
+    if args.batch:
+        return render_batch(args)
     cfg = read_map_config(args.config)
     K = Kartograph()
-    if args.format:
-        format = args.format
-    elif args.output and args.output != '-':
-        format = os.path.splitext(args.output)[1][1:]
-    else:
-        format = 'svg'
+    format = output_format(args.format, args.output)
     try:
 
         # generate the map
@@ -60,15 +61,28 @@ def render_map(args):
             css = None
         if args.output is None and not args.preview:
             args.output = '-'
-        if args.output and args.output != '-':
-            args.output = open(args.output, 'w')
+        # The file name is passed on, so the renderer can open the file in
+        # the right mode and only replaces it once the map is complete.
+
+        if args.verbose:
+            import map as _map
+            _map.verbose = True
 
         if args.pretty_print:
             if 'export' not in cfg:
                 cfg['export'] = {}
             cfg['export']['prettyprint'] = True
 
-        K.generate(cfg, args.output, preview=args.preview, format=format, stylesheet=css)
+        stats = None
+        if args.stats or args.trace:
+            from stats import Stats
+            stats = Stats(vertices=args.stats is not None)
+
+        K.generate(cfg, args.output, preview=args.preview, format=format, stylesheet=css, stats=stats)
+        if args.stats:
+            stats.write_json(args.stats)
+        if args.trace:
+            stats.write_trace(args.trace)
         if not args.output:
             # output to stdout
             # print str(r)
@@ -81,6 +95,49 @@ def render_map(args):
 parser.set_defaults(func=render_map)
 
 
+def render_batch(args):
+    batch = read_map_config(args.config)
+    maps = []
+    try:
+        for entry in batch:
+            cfg = entry['config']
+            if isinstance(cfg, basestring):
+                cfg = read_map_config(open(cfg))
+            css = None
+            if 'style' in entry:
+                css = open(entry['style']).read()
+            # svg or svgz, depending on the output of each map
+            maps.append((cfg, entry['output'], css, output_format(args.format, entry['output'])))
+    except Exception, e:
+        print_error(e)
+        exit(-1)
+
+    start = time.time()
+    K = Kartograph()
+    results = K.generate_many(maps, processes=args.jobs)
+    failed = 0
+    for outfile, seconds, error in results:
+        if error is None:
+            print '%s: %.3f secs' % (outfile, seconds)
+        else:
+            failed += 1
+            print '%s: failed, %s' % (outfile, error)
+    elapsed = time.time() - start
+    print '%d maps in %.3f secs (%.2f maps per sec)' % (len(results), elapsed, len(results) / max(elapsed, 1e-6))
+    if failed:
+        print '%d maps failed' % failed
+        exit(-1)
+
+
+def output_format(format, output):
+    """ returns the given format or guesses it from the output file name """
+    if format:
+        return format
+    if output and output != '-':
+        return os.path.splitext(output)[1][1:]
+    return 'svg'
+
+
 def print_error(err):
     import traceback
     ignore_path_len = len(__file__) - 7
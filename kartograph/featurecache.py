@@ -0,0 +1,91 @@
+"""
+caches the processed features of map layers
+
+When a map is generated again with only some of its options changed,
+e.g. the export rounding or a single layer, the layers that are not
+affected are restored from the cache instead of running through the
+whole pipeline again. Stylesheets are applied by the renderer, so they
+never invalidate the cache.
+
+The features of a layer are cached twice. Once after they have been
+loaded, joined, culled and cropped to the view, which only depends on
+the layer itself, and once more after all stages. Simplification,
+crop-to and subtract-from connect layers with each other, so the final
+features of a layer are only reused if none of the layers it is
+connected to has changed.
+"""
+
+from geometry.utils import count_vertices
+from hashlib import sha1
+from copy import copy
+import os
+
+
+def cache_key(*parts):
+    """ returns a hash of a list of strings """
+    h = sha1()
+    for part in parts:
+        h.update(part)
+        h.update('\0')
+    return h.hexdigest()
+
+
+def options_key(obj):
+    """
+    returns a string representation of an options dictionary that
+    doesn't depend on the order of the keys
+    """
+    if isinstance(obj, dict):
+        return '{%s}' % ', '.join('%s: %s' % (options_key(k), options_key(v))
+            for k, v in sorted(obj.items()))
+    if isinstance(obj, (list, tuple)):
+        return '[%s]' % ', '.join(options_key(v) for v in obj)
+    return repr(obj)
+
+
+def source_key(options):
+    """
+    identifies the source of a layer by the path, size and modification
+    time of its files. returns None if the source can't be identified,
+    e.g. for database sources
+    """
+    if 'src' not in options:
+        # virtual layers are defined by their options alone
+        return ''
+    src = options['src']
+    files = [src]
+    base, ext = os.path.splitext(src)
+    if ext.lower() == '.shp':
+        for sidecar in ('.dbf', '.shx'):
+            if os.path.exists(base + sidecar):
+                files.append(base + sidecar)
+    key = []
+    for filename in files:
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        key.append((os.path.abspath(filename), stat.st_size, stat.st_mtime))
+    return repr(key)
+
+
+def features_weight(features):
+    """
+    returns the weight of a cached list of features for the LRUCache, which
+    is the number of vertices plus one for the list and every feature
+    """
+    return 1 + len(features) + sum(count_vertices(feature.geom) for feature in features)
+
+
+def copy_features(features):
+    """
+    returns copies of a list of features that can be processed without
+    changing the originals. geometries are never modified in place, so
+    they can be shared
+    """
+    copies = []
+    for feature in features:
+        c = copy(feature)
+        c.properties = copy(feature.properties)
+        copies.append(c)
+    return copies
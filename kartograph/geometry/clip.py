@@ -0,0 +1,245 @@
+"""
+fast clipping of geometries to axis-aligned rectangles
+
+Cropping to the map view always happens against a rectangle, so we don't
+need the full machinery of GEOS for it. Geometries that are completely
+inside or outside the rectangle are handled by a simple bounding box test.
+Everything else is clipped in linear time, using Sutherland-Hodgman for
+polygon rings and Liang-Barsky for lines.
+"""
+
+from shapely.geometry import Polygon, MultiPolygon, LineString, MultiLineString, Point, MultiPoint
+from shapely.geos import TopologicalError
+
+
+def clip_to_bbox(geom, bbox):
+    """
+    clips a shapely geometry to a bounding box given as
+    (xmin, ymin, xmax, ymax), returns None if nothing is left
+    """
+    if geom is None or geom.is_empty:
+        return None
+    xmin, ymin, xmax, ymax = bbox[0], bbox[1], bbox[2], bbox[3]
+    rect = (xmin, ymin, xmax, ymax)
+    # fast path: test the bounding box of the entire geometry
+    inside = _bbox_relation(geom.bounds, rect)
+    if inside is True:
+        return geom
+    if inside is False:
+        return None
+
+    if isinstance(geom, (Polygon, MultiPolygon)):
+        polygons = []
+        for polygon in _parts(geom):
+            polygons += _clip_polygon(polygon, rect)
+        if len(polygons) == 0:
+            return None
+        if len(polygons) == 1:
+            return polygons[0]
+        return MultiPolygon(polygons)
+
+    if isinstance(geom, (LineString, MultiLineString)):
+        lines = []
+        for line in _parts(geom):
+            if _bbox_relation(line.bounds, rect) is True:
+                lines.append(list(line.coords))
+            else:
+                lines += clip_line(line.coords, rect)
+        if len(lines) == 0:
+            return None
+        if len(lines) == 1:
+            return LineString(lines[0])
+        return MultiLineString(lines)
+
+    if isinstance(geom, (Point, MultiPoint)):
+        points = [pt for pt in _parts(geom)
+            if xmin <= pt.x <= xmax and ymin <= pt.y <= ymax]
+        if len(points) == 0:
+            return None
+        if len(points) == 1:
+            return points[0]
+        return MultiPoint(points)
+
+    # Anything else (e.g. geometry collections) is left to GEOS.
+    return _intersection(geom, rect)
+
+
+def clip_ring(pts, bbox):
+    """
+    clips a closed ring to a bounding box using the Sutherland-Hodgman
+    algorithm. returns the clipped ring (not closed) and the maximum
+    number of times the ring crossed one of the clipping edges.
+    """
+    xmin, ymin, xmax, ymax = bbox
+    pts = list(pts)
+    if len(pts) > 1 and pts[0] == pts[-1]:
+        pts.pop()
+    crossings = 0
+    for axis, value, keep_greater in ((0, xmin, True), (0, xmax, False), (1, ymin, True), (1, ymax, False)):
+        pts, c = _clip_ring_edge(pts, axis, value, keep_greater)
+        crossings = max(crossings, c)
+        if len(pts) == 0:
+            break
+    return pts, crossings
+
+
+def clip_line(pts, bbox):
+    """
+    clips a line to a bounding box using the Liang-Barsky algorithm.
+    returns a list of lines, since a line may leave and re-enter the box
+    """
+    xmin, ymin, xmax, ymax = bbox
+    lines = []
+    line = None
+    pts = list(pts)
+    for i in range(1, len(pts)):
+        x0, y0 = pts[i - 1][0], pts[i - 1][1]
+        x1, y1 = pts[i][0], pts[i][1]
+        dx = x1 - x0
+        dy = y1 - y0
+        t0, t1 = 0.0, 1.0
+        visible = True
+        for p, q in ((-dx, x0 - xmin), (dx, xmax - x0), (-dy, y0 - ymin), (dy, ymax - y0)):
+            if p == 0:
+                if q < 0:
+                    visible = False
+                    break
+            else:
+                r = q / float(p)
+                if p < 0:
+                    if r > t1:
+                        visible = False
+                        break
+                    if r > t0:
+                        t0 = r
+                else:
+                    if r < t0:
+                        visible = False
+                        break
+                    if r < t1:
+                        t1 = r
+        if not visible:
+            line = None
+            continue
+        if line is None or t0 > 0:
+            # the segment enters the box, so we start a new line
+            line = [(x0 + t0 * dx, y0 + t0 * dy)]
+            lines.append(line)
+        line.append((x0 + t1 * dx, y0 + t1 * dy))
+        if t1 < 1:
+            # the segment leaves the box
+            line = None
+    return [l for l in lines if len(l) > 1]
+
+
+def _clip_polygon(polygon, rect):
+    """ clips a single polygon, returns a list of polygons """
+    rel = _bbox_relation(polygon.bounds, rect)
+    if rel is True:
+        return [polygon]
+    if rel is False:
+        return []
+    ext, crossings = clip_ring(polygon.exterior.coords, rect)
+    if crossings > 2:
+        # The clipped exterior would fall apart into several pieces
+        # connected by zero-width bridges along the clipping edge.
+        # That's a job for GEOS.
+        return _polygons(_intersection(polygon, rect))
+    if len(ext) < 3 or _ring_area(ext) == 0:
+        return []
+    holes = []
+    for interior in polygon.interiors:
+        rel = _bbox_relation(interior.bounds, rect)
+        if rel is True:
+            holes.append(interior)
+        elif rel is None:
+            # holes touching the clipping edge would make the polygon
+            # invalid, so again we ask GEOS
+            return _polygons(_intersection(polygon, rect))
+    return [Polygon(ext, holes)]
+
+
+def _clip_ring_edge(pts, axis, value, keep_greater):
+    """ clips a ring against a single edge of the clipping rectangle """
+    out = []
+    if len(pts) == 0:
+        return out, 0
+    crossings = 0
+    prev = pts[-1]
+    if keep_greater:
+        prev_in = prev[axis] >= value
+    else:
+        prev_in = prev[axis] <= value
+    for pt in pts:
+        if keep_greater:
+            cur_in = pt[axis] >= value
+        else:
+            cur_in = pt[axis] <= value
+        if cur_in != prev_in:
+            crossings += 1
+            out.append(_intersect_edge(prev, pt, axis, value))
+        if cur_in:
+            out.append(pt)
+        prev = pt
+        prev_in = cur_in
+    return out, crossings
+
+
+def _intersect_edge(a, b, axis, value):
+    """ computes the intersection of the segment a-b with a clipping edge """
+    t = (value - a[axis]) / float(b[axis] - a[axis])
+    if axis == 0:
+        return (value, a[1] + t * (b[1] - a[1]))
+    return (a[0] + t * (b[0] - a[0]), value)
+
+
+def _bbox_relation(bounds, rect):
+    """
+    returns True if bounds are inside the rectangle, False if they
+    don't overlap at all and None if they overlap partially
+    """
+    minx, miny, maxx, maxy = bounds
+    xmin, ymin, xmax, ymax = rect
+    if minx >= xmin and maxx <= xmax and miny >= ymin and maxy <= ymax:
+        return True
+    if minx > xmax or maxx < xmin or miny > ymax or maxy < ymin:
+        return False
+    return None
+
+
+def _ring_area(pts):
+    """ computes the (unsigned) area of a ring """
+    s = 0
+    n = len(pts)
+    for i in range(n):
+        x1, y1 = pts[i - 1]
+        x2, y2 = pts[i]
+        s += x1 * y2 - x2 * y1
+    return abs(s) * 0.5
+
+
+def _intersection(geom, rect):
+    """ intersects a geometry with a rectangle using GEOS """
+    xmin, ymin, xmax, ymax = rect
+    poly = Polygon([(xmin, ymin), (xmin, ymax), (xmax, ymax), (xmax, ymin)])
+    if not geom.is_valid:
+        return geom
+    try:
+        geom = geom.intersection(poly)
+    except TopologicalError:
+        return None
+    if geom.is_empty:
+        return None
+    return geom
+
+
+def _polygons(geom):
+    """ returns the polygonal parts of a geometry """
+    return [p for p in _parts(geom) if isinstance(p, Polygon)]
+
+
+def _parts(geom):
+    """ returns a list of the parts of a geometry """
+    if geom is None:
+        return []
+    return hasattr(geom, 'geoms') and list(geom.geoms) or [geom]
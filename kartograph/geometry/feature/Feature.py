@@ -1,4 +1,5 @@
 from shapely.geos import TopologicalError
+from kartograph.geometry.utils import same_type_parts, union_geometries
 import sys
 
 verbose = False
@@ -34,7 +35,7 @@ class Feature:
             if self.geometry.is_valid and geometry.is_valid:
                 if self.geometry.intersects(geometry):
                     try:
-                        self.geometry = self.geometry.intersection(geometry)
+                        self.geometry = same_type_parts(self.geometry.intersection(geometry), self.geometry)
                     except TopologicalError:
                         self.geometry = None
                 else:
@@ -43,6 +44,47 @@ class Feature:
                 if verbose:
                     sys.stderr.write("warning: geometry is invalid")
 
+    def crop_to_all(self, geometries):
+        """
+        crops the feature to the union of a list of geometries. it's a
+        lot cheaper to intersect the feature with each of them and merge
+        the pieces than computing the union of the (usually much larger)
+        geometries first
+        """
+        if self.geometry:
+            if self.geometry.is_valid:
+                pieces = []
+                for geometry in geometries:
+                    try:
+                        pieces.append(self.geometry.intersection(geometry))
+                    except TopologicalError:
+                        pass
+                pieces = [p for p in pieces if not p.is_empty]
+                if len(pieces) > 0:
+                    self.geometry = same_type_parts(union_geometries(pieces), self.geometry)
+                else:
+                    self.geometry = None
+            else:
+                if verbose:
+                    sys.stderr.write("warning: geometry is invalid")
+
+    def crop_to_bbox(self, bbox):
+        """
+        crops the feature to a rectangle, which is much faster than
+        crop_to() for the common case of cropping to the map view
+        """
+        from kartograph.geometry.clip import clip_to_bbox
+        if self.geometry:
+            self.geometry = clip_to_bbox(self.geometry, bbox)
+
+    def cull(self, min_size):
+        """
+        removes parts of the feature that are smaller than min_size,
+        returns the number of removed parts and holes
+        """
+        from kartograph.geometry.utils import cull_small_parts
+        self.geometry, parts, holes = cull_small_parts(self.geometry, min_size)
+        return parts, holes
 
     def subtract_geom(self, geom):
         if self.geometry:
@@ -24,6 +24,7 @@ class MultiLineFeature(Feature):
         for line in self._geoms:
             rings.append(line.coords)
         self._topology_rings = unify_rings(rings, point_store, precision=precision, feature=self)
+        self._topology_store = point_store
 
     def break_into_lines(self):
         """
@@ -37,12 +38,13 @@ class MultiLineFeature(Feature):
         restores geometry from linear rings
         """
         from shapely.geometry import LineString, MultiLineString
+        store = self._topology_store
         linestrings = []
         for line in lines:
             kept = []
             for pt in line:
-                if not pt.deleted:
-                    kept.append((pt[0], pt[1]))
+                if not store.deleted[pt]:
+                    kept.append((store.x[pt], store.y[pt]))
             if len(kept) >= 2:
                 linestrings.append(LineString(kept))
 
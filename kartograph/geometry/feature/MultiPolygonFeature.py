@@ -1,6 +1,7 @@
 from Feature import Feature
 from kartograph.errors import KartographError
 from kartograph.simplify.unify import unify_rings
+from array import array
 
 
 class MultiPolygonFeature(Feature):
@@ -28,6 +29,7 @@ class MultiPolygonFeature(Feature):
                 rings.append(hole.coords)
         self._topology_rings = unify_rings(rings, point_store, precision=precision, feature=self)
         self._topology_num_holes = num_holes
+        self._topology_store = point_store
 
     def break_into_lines(self):
         """
@@ -35,6 +37,7 @@ class MultiPolygonFeature(Feature):
         to preserve topology during simplification
         """
         # print '\n\n', self.props['NAME_1'],
+        fs = self._topology_store.features
         lines = []
         lines_per_ring = []
         for ring in self._topology_rings:
@@ -44,7 +47,7 @@ class MultiPolygonFeature(Feature):
             K = len(ring)
             # print '\n\tnew ring (' + str(K) + ')',
             # find first break-point
-            while i < K and ring[i].features == ring[i - 1].features:
+            while i < K and fs[ring[i]] == fs[ring[i - 1]]:
                 i += 1
             if i == len(ring):  # no break-point found at all
                 line = ring  # so the entire ring is treated as one line
@@ -64,7 +67,7 @@ class MultiPolygonFeature(Feature):
                 i = a + 1  # proceed to next point
                 if i == K:
                     i = 0  # wrap around to first point if needed
-                while i != s and ring[i].features == ring[((i - 1) + len(ring)) % len(ring)].features:  # look for end of this line
+                while i != s and fs[ring[i]] == fs[ring[((i - 1) + len(ring)) % len(ring)]]:  # look for end of this line
                     line.append(i)  # add point to line
                     i += 1  # proceed to next point
                     if i == K:
@@ -76,8 +79,8 @@ class MultiPolygonFeature(Feature):
                 #if a == s:  # if next starting point is the first break point..
                 # line.append(s)  # append
                 # print len(line),
-                for ll in range(len(line)):
-                    line[ll] = ring[line[ll]]  # replace point indices with actual points
+                # replace ring indices with actual point ids
+                line = array('l', [ring[ll] for ll in line])
                 lines.append(line)  # store line
             lines_per_ring.append(l)
 
@@ -89,6 +92,10 @@ class MultiPolygonFeature(Feature):
         restores geometry from linear rings
         """
         from shapely.geometry import Polygon, MultiPolygon
+        store = self._topology_store
+        xs = store.x
+        ys = store.y
+        deleted = store.deleted
         # at first we restore the rings
         rings = []
         isIslands = []
@@ -99,10 +106,10 @@ class MultiPolygonFeature(Feature):
             for k in range(p, p + l):
                 line = []
                 for pt in lines[k]:
-                    if len(pt.features) > 1:
+                    if island and store.is_shared(pt):
                         island = False
-                    if not pt.deleted:
-                        line.append((pt[0], pt[1]))
+                    if not deleted[pt]:
+                        line.append((xs[pt], ys[pt]))
                 ring += line
             p += l
             rings.append(ring)
@@ -10,3 +10,11 @@ class PointFeature(Feature):
             if self.geometry.is_valid:
                 if not self.geometry.intersects(geometry):
                     self.geometry = None
+
+    def crop_to_all(self, geometries):
+        if self.geometry:
+            if self.geometry.is_valid:
+                for geometry in geometries:
+                    if self.geometry.intersects(geometry):
+                        return
+                self.geometry = None
@@ -0,0 +1,70 @@
+"""
+simple grid-based spatial index
+
+Used for finding the features of another layer that could intersect a
+given geometry, e.g. for crop-to and subtract-from, without testing
+every pair of features.
+"""
+
+from math import sqrt, floor
+
+
+class GridIndex(object):
+    """
+    indexes objects by their bounding boxes (minx, miny, maxx, maxy) in
+    a regular grid. queries return the objects in the order they have
+    been added, so results don't depend on the grid layout.
+    """
+
+    def __init__(self, items):
+        """ items is a list of (bounds, object) tuples """
+        self._items = [(bounds, obj) for bounds, obj in items if bounds]
+        self._cells = {}
+        if len(self._items) == 0:
+            return
+        minx = min(b[0] for b, o in self._items)
+        miny = min(b[1] for b, o in self._items)
+        maxx = max(b[2] for b, o in self._items)
+        maxy = max(b[3] for b, o in self._items)
+        # aim at about one object per cell
+        n = max(1, int(sqrt(len(self._items))))
+        self._x0 = minx
+        self._y0 = miny
+        self._cw = max((maxx - minx) / n, 1e-9)
+        self._ch = max((maxy - miny) / n, 1e-9)
+        self._extent = (minx, miny, maxx, maxy)
+        for i, (bounds, obj) in enumerate(self._items):
+            for cell in self._cells_for(bounds):
+                self._cells.setdefault(cell, []).append(i)
+
+    def _cells_for(self, bounds):
+        x0 = int(floor((bounds[0] - self._x0) / self._cw))
+        y0 = int(floor((bounds[1] - self._y0) / self._ch))
+        x1 = int(floor((bounds[2] - self._x0) / self._cw))
+        y1 = int(floor((bounds[3] - self._y0) / self._ch))
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield (x, y)
+
+    def query(self, bounds):
+        """ returns the objects whose bounding boxes intersect bounds """
+        if len(self._items) == 0 or not bounds:
+            return []
+        # limit the query to the extent of the index, so huge query
+        # boxes don't loop over lots of empty cells
+        ext = self._extent
+        clamped = (max(bounds[0], ext[0]), max(bounds[1], ext[1]),
+            min(bounds[2], ext[2]), min(bounds[3], ext[3]))
+        found = set()
+        cells = self._cells
+        for cell in self._cells_for(clamped):
+            if cell in cells:
+                found.update(cells[cell])
+        minx, miny, maxx, maxy = bounds
+        out = []
+        for i in sorted(found):
+            b, obj = self._items[i]
+            if b[0] <= maxx and b[2] >= minx and b[1] <= maxy and b[3] >= miny:
+                out.append(obj)
+        return out
+
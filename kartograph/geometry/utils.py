@@ -58,10 +58,119 @@ def geom_to_bbox(geom, min_area=0):
     return bbox
 
 
+def cull_small_parts(geom, min_size):
+    """
+    removes polygons, holes and lines whose bounding box is smaller than
+    min_size in both directions. returns the remaining geometry (or None)
+    and the number of removed parts and holes
+    """
+    from shapely.geometry import Polygon, MultiPolygon, LineString, MultiLineString
+
+    def is_small(bounds):
+        # empty parts have no bounds at all
+        return len(bounds) == 0 or (bounds[2] - bounds[0] < min_size and bounds[3] - bounds[1] < min_size)
+
+    if geom is None or geom.is_empty:
+        # e.g. polygons that have been joined with a negative buffer
+        return None, 0, 0
+    if not isinstance(geom, (Polygon, MultiPolygon, LineString, MultiLineString)):
+        # points are never too small
+        return geom, 0, 0
+    if is_small(geom.bounds):
+        # the whole geometry is too small
+        parts = hasattr(geom, 'geoms') and len(geom.geoms) or 1
+        return None, parts, 0
+
+    if isinstance(geom, (Polygon, MultiPolygon)):
+        polygons = []
+        dropped = 0
+        dropped_holes = 0
+        for polygon in hasattr(geom, 'geoms') and geom.geoms or [geom]:
+            if is_small(polygon.bounds):
+                dropped += 1
+                continue
+            holes = [hole for hole in polygon.interiors if not is_small(hole.bounds)]
+            if len(holes) < len(polygon.interiors):
+                dropped_holes += len(polygon.interiors) - len(holes)
+                polygon = Polygon(polygon.exterior, holes)
+            polygons.append(polygon)
+        if dropped == 0 and dropped_holes == 0:
+            return geom, 0, 0
+        if len(polygons) == 0:
+            return None, dropped, dropped_holes
+        if isinstance(geom, Polygon):
+            return polygons[0], dropped, dropped_holes
+        return MultiPolygon(polygons), dropped, dropped_holes
+
+    if isinstance(geom, MultiLineString):
+        lines = [line for line in geom.geoms if not is_small(line.bounds)]
+        if len(lines) == len(geom.geoms):
+            return geom, 0, 0
+        if len(lines) == 0:
+            return None, len(geom.geoms), 0
+        return MultiLineString(lines), len(geom.geoms) - len(lines), 0
+
+    return geom, 0, 0
+
+
+def count_vertices(geom):
+    """ returns the number of coordinates of a geometry """
+    if geom is None or geom.is_empty:
+        return 0
+    if hasattr(geom, 'geoms'):
+        return sum(count_vertices(part) for part in geom.geoms)
+    if hasattr(geom, 'exterior'):
+        return len(geom.exterior.coords) + sum(len(ring.coords) for ring in geom.interiors)
+    return len(geom.coords)
+
+
+def union_geometries(geoms):
+    """
+    returns the union of a list of geometries, which is a lot faster
+    than merging them one by one
+    """
+    try:
+        # shapely 1.2.16+
+        from shapely.ops import unary_union
+    except ImportError:
+        from shapely.ops import cascaded_union as unary_union
+    if len(geoms) == 1:
+        return geoms[0]
+    return unary_union(geoms)
+
+
+def same_type_parts(geom, like):
+    """
+    intersections may return geometry collections that mix lines and
+    points etc. this returns only the parts that have the same dimension
+    as the geometry like, as a multi-geometry, or None if there are none
+    """
+    from shapely.geometry import GeometryCollection, MultiPolygon, MultiLineString, MultiPoint
+    if geom is None or geom.is_empty:
+        return None
+    if not isinstance(geom, GeometryCollection) or isinstance(geom, (MultiPolygon, MultiLineString, MultiPoint)):
+        return geom
+    parts = []
+    for part in geom.geoms:
+        if hasattr(part, 'geoms'):
+            parts += list(part.geoms)
+        else:
+            parts.append(part)
+    parts = [p for p in parts if p.geom_type in like.geom_type]
+    if len(parts) == 0:
+        return None
+    if like.geom_type.endswith('Polygon'):
+        return MultiPolygon(parts)
+    if like.geom_type.endswith('LineString'):
+        return MultiLineString(parts)
+    return MultiPoint(parts)
+
+
 def join_features(features, props, buf=False):
     """ joins polygonal features
     """
     from feature import MultiPolygonFeature, MultiLineFeature
+    from shapely.geometry import MultiPolygon
     from shapely.ops import linemerge
 
     if len(features) == 0:
@@ -81,13 +190,18 @@ def join_features(features, props, buf=False):
 
     polygons = filter(lambda x: x is not None, polygons)
     if len(polygons) > 0:
-        poly = polygons[0]
-        if buf is not False:
-            poly = poly.buffer(buf, 4)
-        for poly2 in polygons[1:]:
-            if buf is not False:
-                poly2 = poly2.buffer(buf, 4)
-            poly = poly.union(poly2)
+        if buf is not False and buf < 0:
+            # Shrinking the union would only shrink its outline, so every
+            # polygon is eroded on its own before they are merged.
+            poly = union_geometries([poly.buffer(buf, 4) for poly in polygons])
+        elif buf is not False:
+            # Growing all polygons at once also merges them.
+            parts = []
+            for poly in polygons:
+                parts += hasattr(poly, 'geoms') and list(poly.geoms) or [poly]
+            poly = MultiPolygon(parts).buffer(buf, 4)
+        else:
+            poly = union_geometries(polygons)
         joined.append(MultiPolygonFeature(poly, props))
 
     if len(lines) > 0:
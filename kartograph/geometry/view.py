@@ -11,11 +11,14 @@ class View(object):
     """
     translates a point to a view
     """
-    def __init__(self, bbox=None, width=None, height=None, padding=0):
+    def __init__(self, bbox=None, width=None, height=None, padding=0, quantize=None):
         self.bbox = bbox
         self.width = width
         self.padding = padding
         self.height = height
+        # If set, geometries are snapped to a grid with this number of
+        # decimals, see project_linear_ring()
+        self.quantize = quantize
         if bbox:
             self.scale = min((width - padding * 2) / bbox.width, (height - padding * 2) / bbox.height)
 
@@ -84,23 +87,44 @@ class View(object):
                     return Point(res[0])
 
     def project_polygon(self, polygon):
-        ext = self.project_linear_ring(polygon.exterior)
+        ext = self.project_linear_ring(polygon.exterior, 4)
         if len(ext) == 1:
             pts_int = []
             for interior in polygon.interiors:
-                pts_int += self.project_linear_ring(interior)
+                pts_int += self.project_linear_ring(interior, 4)
             return [Polygon(ext[0], pts_int)]
         elif len(ext) == 0:
             return []
         else:
             raise KartographError('unhandled case: exterior is split into multiple rings')
 
-    def project_linear_ring(self, ring):
+    def project_linear_ring(self, ring, min_points=2):
+        if self.quantize is not None:
+            return self._project_quantized(ring, min_points)
         points = []
         for pt in ring.coords:
             x, y = self.project(pt)
             points.append((x, y))
         return [points]
 
+    def _project_quantized(self, ring, min_points):
+        """
+        projects a ring and snaps its points to the quantization grid.
+        points that end up on the same spot as the previous one are
+        removed, as well as rings that have less than min_points left
+        """
+        points = []
+        last = None
+        f = 10 ** self.quantize
+        for pt in ring.coords:
+            x, y = self.project(pt)
+            pt = (round(x * f) / f, round(y * f) / f)
+            if pt != last:
+                points.append(pt)
+                last = pt
+        if len(points) < min_points:
+            return []
+        return [points]
+
     def __str__(self):
         return 'View(w=%f, h=%f, pad=%f, scale=%f, bbox=%s)' % (self.width, self.height, self.padding, self.scale, self.bbox)
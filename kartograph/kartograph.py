@@ -1,12 +1,15 @@
 
-from options import parse_options
+from options import MapOptions
 from shapely.geometry import Polygon, LineString, MultiPolygon
 from errors import *
-from copy import deepcopy
-from renderer import SvgRenderer
+from renderer import SvgRenderer, SvgzRenderer
 from mapstyle import MapStyle
 from map import Map
+from lrucache import LRUCache
+from featurecache import options_key, features_weight
+from collections import OrderedDict
 import os
+import time
 
 
 # Kartograph
@@ -14,36 +17,54 @@ import os
 
 verbose = False
 
+# Every instance keeps the topologies of this many sets of simplified
+# features, see [lrucache.py](lrucache.py).
+max_cached_topologies = 4
+# ...and processed features with up to this many vertices in total, see
+# [featurecache.py](featurecache.py). Every map adds the features of each
+# layer up to twice. A cached vertex takes about 80 bytes, so the cache
+# uses up to about 20 MB. Set it to 0 to turn the cache off.
+max_cached_vertices = 250000
+
 # These renderers are currently available. See [renderer/svg.py](renderer/svg.html)
 
 _known_renderer = {
-    'svg': SvgRenderer
+    'svg': SvgRenderer,
+    'svgz': SvgzRenderer
 }
 
 
 class Kartograph(object):
     def __init__(self):
         self.layerCache = {}
-        pass
+        self.topologyCache = LRUCache(max_cached_topologies)
+        self.featureCache = LRUCache(max_cached_vertices, weight=features_weight)
+        self.projectionCache = OrderedDict()
 
-    def generate(self, opts, outfile=None, format='svg', preview=None, stylesheet=None):
+    def generate(self, opts, outfile=None, format='svg', preview=None, stylesheet=None, stats=None):
         """
         Generates a the map and renders it using the specified output format.
+        If a [Stats](stats.py) instance is passed, the time spent in each stage
+        of the map will be recorded in it.
+
+        opts can be a plain options dictionary or a [MapOptions](options.py)
+        instance, which is parsed only once and can be reused for many maps.
         """
         if preview is None:
             preview = outfile is None
 
-        # Create a deep copy of the options dictionary so our changes will not be
-        # visible to the calling application.
-        opts = deepcopy(opts)
-
-        # Parse the options dictionary. See options.py for more details.
-        parse_options(opts)
+        # Parse the options dictionary into read-only options, so our changes
+        # will not be visible to the calling application. See options.py for
+        # more details.
+        if not isinstance(opts, MapOptions):
+            opts = MapOptions(opts)
 
         # Create the map instance. It will do all the hard work for us, so you
         # definitely should check out [map.py](map.html) for all the fun stuff happending
         # there..
-        _map = Map(opts, self.layerCache, format=format)
+        _map = Map(opts, self.layerCache, format=format, topologyCache=self.topologyCache,
+            stats=stats, featureCache=self.featureCache, projectionCache=self.projectionCache)
+        stats = _map.stats
 
         # Check if the format is handled by a renderer.
         format = format.lower()
@@ -52,7 +73,14 @@ class Kartograph(object):
             style = MapStyle(stylesheet)
             # Create a renderer instance and render the map.
             renderer = _known_renderer[format](_map)
-            renderer.render(style, opts['export']['prettyprint'])
+            if outfile is not None and not preview and opts['export']['streaming']:
+                # The map is written while it's rendered, so the time
+                # spent writing it is part of the render stage.
+                with stats.measure('render'):
+                    renderer.render(style, opts['export']['prettyprint'], outfile=outfile)
+                return
+            with stats.measure('render'):
+                renderer.render(style, opts['export']['prettyprint'])
 
             if preview:
                 if 'KARTOGRAPH_PREVIEW' in os.environ:
@@ -70,13 +98,100 @@ class Kartograph(object):
             # Write the map to a file or return the renderer instance.
             if outfile is None:
                 return renderer
-            elif outfile == '-':
-                print renderer
-            else:
-                renderer.write(outfile)
+            with stats.measure('write'):
+                if outfile == '-':
+                    print renderer
+                else:
+                    renderer.write(outfile)
         else:
             raise KartographError('unknown format: %s' % format)
 
+    def generate_many(self, maps, format='svg', stylesheet=None, processes=1):
+        """
+        Generates a list of maps, given as (opts, outfile) tuples, optionally
+        followed by a stylesheet and a format for the map. Maps using the same sources and projection are
+        generated one after another by the same Kartograph instance, so they
+        share the loaded sources, projected geometries and topologies. With
+        more than one process, the outfiles need to be file names.
+
+        Returns a list of (outfile, seconds, error) tuples in the order of
+        the maps, error being None for maps that have been generated.
+        """
+        results = [None] * len(maps)
+
+        # Group the maps by their sources and projection. The options are
+        # parsed first, so a map with invalid options only fails itself.
+        groups = OrderedDict()
+        for i, m in enumerate(maps):
+            m = tuple(m) + (stylesheet, format)[len(m) - 2:]
+            start = time.time()
+            try:
+                opts = m[0]
+                if not isinstance(opts, MapOptions):
+                    opts = MapOptions(opts)
+                sources = sorted(set(repr(layer.get('src')) for layer in opts['layers']))
+                key = (options_key(opts['proj']), tuple(sources))
+            except Exception, e:
+                results[i] = (m[1], time.time() - start, '%s: %s' % (e.__class__.__name__, e))
+                continue
+            groups.setdefault(key, []).append((i, opts) + m[1:])
+
+        if processes <= 1:
+            chunks = [sum(groups.values(), [])]
+        else:
+            # Large groups are split up so all processes have something to do.
+            size = max(1, (len(maps) + processes - 1) // processes)
+            chunks = []
+            for group in groups.values():
+                for j in range(0, len(group), size):
+                    chunks.append(group[j:j + size])
+
+        if processes <= 1:
+            for chunk in chunks:
+                for i, outfile, seconds, error in _generate_chunk(chunk, self):
+                    results[i] = (outfile, seconds, error)
+        else:
+            from multiprocessing import Pool
+            pool = Pool(processes)
+            try:
+                done = pool.map(_generate_chunk_worker, chunks)
+            finally:
+                pool.close()
+                pool.join()
+            for chunk in done:
+                for i, outfile, seconds, error in chunk:
+                    results[i] = (outfile, seconds, error)
+        return results
+
+
+def _generate_chunk(chunk, kartograph):
+    """
+    generates a list of (index, opts, outfile, stylesheet, format) maps,
+    returns the time needed for each map and the errors
+    """
+    results = []
+    for i, opts, outfile, stylesheet, format in chunk:
+        start = time.time()
+        error = None
+        try:
+            kartograph.generate(opts, outfile, format=format, preview=False, stylesheet=stylesheet)
+        except Exception, e:
+            error = '%s: %s' % (e.__class__.__name__, e)
+        results.append((i, outfile, time.time() - start, error))
+    return results
+
+
+# Every worker process keeps its own instance, so its caches are kept
+# between the chunks it is given.
+_worker_kartograph = None
+
+
+def _generate_chunk_worker(chunk):
+    global _worker_kartograph
+    if _worker_kartograph is None:
+        _worker_kartograph = Kartograph()
+    return _generate_chunk(chunk, _worker_kartograph)
+
 
 # Here are some handy methods for debugging Kartograph. It will plot a given shapely
 # geometry using matplotlib and descartes.
@@ -104,17 +219,17 @@ def _plot_geometry(geom, fill='#ffcccc', stroke='#333333', alpha=1, msg=None):
     pyplot.show()
 
 
-def _plot_lines(lines):
+def _plot_lines(lines, point_store):
     from matplotlib import pyplot
 
     def plot_line(ax, line):
         filtered = []
         for pt in line:
-            if not pt.deleted:
-                filtered.append(pt)
+            if not point_store.deleted[pt]:
+                filtered.append((point_store.x[pt], point_store.y[pt]))
         if len(filtered) < 2:
             return
-        ob = LineString(line)
+        ob = LineString(filtered)
         x, y = ob.xy
         ax.plot(x, y, '-', color='#333333', linewidth=0.5, solid_capstyle='round', zorder=1)
 
@@ -42,11 +42,9 @@ def handle_layer_source(layer, cache={}):
             src = CsvLayer(src, mode=mode, xfield=x_field, yfield=y_field, dialect=dialect, crs=crs)
             return src
         elif src[:8] == "postgis:":
-            if 'query' not in layer:
-                layer['query'] = 'true'
             if 'table' not in layer:
                 raise KartographLayerSourceError('you need to specify a table')
-            src = PostGISLayer(src[8:], query=layer['query'], table=layer['table'])
+            src = PostGISLayer(src[8:], query=_get(layer, 'query', 'true'), table=layer['table'])
             return src
         else:
             raise KartographLayerSourceError('don\'t know how to handle "' + src + '"')
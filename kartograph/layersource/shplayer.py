@@ -27,6 +27,12 @@ class ShapefileLayer(LayerSource):
         self.sr = shapefile.Reader(src)
         self.recs = []
         self.shapes = {}
+        # The decoded records, bounding boxes and geometries are kept, so
+        # shapes that are requested more than once, e.g. for computing the
+        # map bounds and for the layer itself, are only decoded once.
+        self._props = {}
+        self._bboxes = {}
+        self._geoms = {}
         self.load_records()
         self.proj = None
         # Check if there's a spatial reference
@@ -72,6 +78,60 @@ class ShapefileLayer(LayerSource):
         if i in self.shapes:
             self.shapes.pop(i)
 
+    def get_geometry(self, i, ignore_holes=False, min_area=False):
+        """
+        ### Get geometry
+        Returns the shape converted into a shapely geometry.
+        """
+        key = (i, ignore_holes, min_area)
+        if key not in self._geoms:
+            self._geoms[key] = shape2geometry(self.get_shape(i), ignore_holes=ignore_holes,
+                min_area=min_area, proj=self.proj)
+            # We don't need the raw shape anymore. Also, projected shapes
+            # are converted in place, so they can't be converted twice.
+            self.forget_shape(i)
+        return self._geoms[key]
+
+    def shape_in_bbox(self, i, bbox):
+        """
+        ### Shape in bbox
+        Checks if the bounding box of a shape (in lat/lon) intersects bbox.
+        """
+        if i not in self._bboxes:
+            self._bboxes[i] = shape_bbox(self.get_shape(i), proj=self.proj)
+        sbbox = self._bboxes[i]
+        return sbbox is None or bbox.intersects(sbbox)
+
+    def decode_record(self, i, try_encodings):
+        """
+        ### Decode record
+        Returns the attributes of a record decoded to unicode.
+        """
+        key = (i, try_encodings[0])
+        if key in self._props:
+            return dict(self._props[key])
+        props = {}
+        # ..we try to decode the attributes (shapefile charsets are arbitrary)
+        for j in range(len(self.attributes)):
+            val = self.recs[i][j]
+            decoded = False
+            if isinstance(val, str):
+                for enc in try_encodings:
+                    try:
+                        val = val.decode(enc)
+                        decoded = True
+                        break
+                    except:
+                        if verbose:
+                            print 'warning: could not decode "%s" to %s' % (val, enc)
+                if not decoded:
+                    raise KartographError('having problems to decode the input data "%s"' % val)
+            if isinstance(val, (str, unicode)):
+                val = val.strip()
+            props[self.attributes[j]] = val
+        self._props[key] = props
+        return dict(props)
+
     def get_features(self, attr=None, filter=None, bbox=None, ignore_holes=False, min_area=False, charset='utf-8'):
         """
         ### Get features
@@ -94,31 +154,16 @@ class ShapefileLayer(LayerSource):
                 drec[self.attributes[j]] = self.recs[i][j]
             # For each record that is not filtered..
             if filter is None or filter(drec):
-                props = {}
-                # ..we try to decode the attributes (shapefile charsets are arbitrary)
-                for j in range(len(self.attributes)):
-                    val = self.recs[i][j]
-                    decoded = False
-                    if isinstance(val, str):
-                        for enc in try_encodings:
-                            try:
-                                val = val.decode(enc)
-                                decoded = True
-                                break
-                            except:
-                                if verbose:
-                                    print 'warning: could not decode "%s" to %s' % (val, enc)
-                        if not decoded:
-                            raise KartographError('having problems to decode the input data "%s"' % val)
-                    if isinstance(val, (str, unicode)):
-                        val = val.strip()
-                    props[self.attributes[j]] = val
+                # ..we check if the shape is within the bbox..
+                if bbox and not self.shape_in_bbox(i, bbox):
+                    ignored += 1
+                    self.forget_shape(i)
+                    continue
 
-                # Read the shape from the shapefile (can take some time..)..
-                shp = self.get_shape(i)
+                props = self.decode_record(i, try_encodings)
 
-                # ..and convert the raw shape into a shapely.geometry
-                geom = shape2geometry(shp, ignore_holes=ignore_holes, min_area=min_area, bbox=bbox, proj=self.proj)
+                # ..and convert the raw shape into a shapely.geometry (can take some time..)
+                geom = self.get_geometry(i, ignore_holes=ignore_holes, min_area=min_area)
                 if geom is None:
                     ignored += 1
                     self.forget_shape(i)
@@ -135,17 +180,27 @@ class ShapefileLayer(LayerSource):
 # # shape2geometry
 
 
+def shape_bbox(shp, proj=None):
+    """
+    returns the bounding box of a shape in lat/lon, or None for
+    points and missing shapes
+    """
+    if shp is None or shp.shapeType == 1:
+        return None
+    if proj:
+        left, top = proj(shp.bbox[0], shp.bbox[1], inverse=True)
+        right, btm = proj(shp.bbox[2], shp.bbox[3], inverse=True)
+    else:
+        left, top, right, btm = shp.bbox
+    return BBox(left=left, top=top, width=right - left, height=btm - top)
+
+
 def shape2geometry(shp, ignore_holes=False, min_area=False, bbox=False, proj=None):
     if shp is None:
         return None
-    if bbox and shp.shapeType != 1:
-        if proj:
-            left, top = proj(shp.bbox[0], shp.bbox[1], inverse=True)
-            right, btm = proj(shp.bbox[2], shp.bbox[3], inverse=True)
-        else:
-            left, top, right, btm = shp.bbox
-        sbbox = BBox(left=left, top=top, width=right - left, height=btm - top)
-        if not bbox.intersects(sbbox):
+    if bbox:
+        sbbox = shape_bbox(shp, proj=proj)
+        if sbbox is not None and not bbox.intersects(sbbox):
             # ignore the shape if it's not within the bbox
             return None
 
@@ -0,0 +1,95 @@
+"""
+a dictionary that only keeps the most recently used entries
+
+Kartograph instances keep topologies and processed features between
+maps. Generating hundreds of maps with one instance would keep all of
+them in memory, so these caches forget the entries that haven't been
+used for the longest time:
+
+    >>> cache = LRUCache(2)
+    >>> cache['a'] = 1
+    >>> cache['b'] = 2
+    >>> cache.get('a')
+    1
+    >>> cache['c'] = 3
+    >>> 'b' in cache, 'a' in cache, 'c' in cache
+    (False, True, True)
+
+The size of a cache can also be measured by a weight function, e.g. the
+number of vertices of the cached features. Entries heavier than the
+whole cache are not kept at all:
+
+    >>> cache = LRUCache(10, weight=len)
+    >>> cache['a'] = 'aaaa'
+    >>> cache['b'] = 'bbbbbb'
+    >>> cache['c'] = 'cc'
+    >>> 'a' in cache, 'b' in cache, 'c' in cache
+    (False, True, True)
+    >>> cache['d'] = 'd' * 11
+    >>> 'd' in cache, cache.weight
+    (False, 8)
+
+The caches are filled by the layer stages, which may run in several
+threads, so all access is locked. Use get() instead of testing for a
+key first, since another thread may evict it in between.
+"""
+
+from collections import OrderedDict
+import threading
+
+
+class LRUCache(object):
+
+    def __init__(self, size, weight=None):
+        self.size = size
+        # the total weight of the entries, which are all 1 by default
+        self.weight = 0
+        self._weigh = weight
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """ returns the value of a key and marks it as recently used """
+        with self._lock:
+            if key not in self._items:
+                return default
+            entry = self._items.pop(key)
+            self._items[key] = entry
+            return entry[0]
+
+    def __getitem__(self, key):
+        value = self.get(key, _missing)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        weight = self._weigh is None and 1 or self._weigh(value)
+        with self._lock:
+            self._discard(key)
+            if weight > self.size:
+                return
+            self._items[key] = (value, weight)
+            self.weight += weight
+            while self.weight > self.size:
+                self._discard(next(iter(self._items)))
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.weight = 0
+
+    def _discard(self, key):
+        if key in self._items:
+            value, weight = self._items.pop(key)
+            self.weight -= weight
+
+
+_missing = object()
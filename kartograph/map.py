@@ -1,11 +1,16 @@
 from shapely.geometry import Polygon
 from shapely.geometry.base import BaseGeometry
 from maplayer import MapLayer
-from geometry.utils import geom_to_bbox
+from geometry.utils import geom_to_bbox, union_geometries
 from geometry import BBox, View
+from geometry.index import GridIndex
+from shapely.prepared import prep
 from proj import projections
 from filter import filter_record
 from errors import KartographError
+from stats import Stats
+from featurecache import cache_key, options_key, source_key, copy_features
+from hashlib import sha1
 import sys
 
 # Map
@@ -17,10 +22,14 @@ import sys
 
 verbose = False
 
+# Projected geometries are cached for this many projections.
+max_cached_projections = 8
+
 
 class Map(object):
 
-    def __init__(me, options, layerCache, format='svg', src_encoding=None):
+    def __init__(me, options, layerCache, format='svg', src_encoding=None, topologyCache=None, stats=None, featureCache=None,
+            projectionCache=None):
         me.options = options
         me.format = format
         # List and dictionary references to the map layers.
@@ -34,6 +43,19 @@ class Map(object):
         if not src_encoding:
             src_encoding = 'utf-8'
         me._source_encoding = src_encoding
+        # The topology of simplified layers is cached in here, if given.
+        me._topology_cache = topologyCache
+        # The processed features of each layer are cached in here, if given,
+        # see [featurecache.py](featurecache.py).
+        me._feature_cache = featureCache
+        me._cached_layers = set()
+        # Projected geometries are cached in here, if given, so maps that
+        # use the same projection only need to project them once.
+        me._projection_cache = projectionCache
+        # Timing and size statistics of the map stages, see [stats.py](stats.py).
+        if stats is None:
+            stats = Stats()
+        me.stats = stats
 
         # Construct [MapLayer](maplayer.py) instances for every layer and store references
         # to the layers in a list and a dictionary.
@@ -46,8 +68,10 @@ class Map(object):
         # Initialize the projection that will be used in this map. This sounds easier than
         # it is since we need to compute lot's of stuff here.
         me.proj = me._init_projection()
+        me._projected_geoms = me._get_projection_cache()
         # Compute the bounding geometry for the map.
-        me.bounds_poly = me._init_bounds()
+        with stats.measure('bounds'):
+            me.bounds_poly = me._init_bounds()
         # Set up the [view](geometry/view.py) which will transform from projected coordinates
         # (e.g. in meters) to screen coordinates in our map output.
         me.view = me._get_view()
@@ -55,18 +79,34 @@ class Map(object):
         # to clip away unneeded geometry unless *cfg['export']['crop-to-view']* is set to false.
         me.view_poly = me._init_view_poly()
 
-        # Load all features that could be visible in each layer. The feature geometries will
-        # be projected and transformed to screen coordinates.
-        for layer in me.layers:
-            layer.get_features()
-
-        # In each layer we will join polygons.
-        me._join_features()
-        # Eventually we crop geometries to the map bounding rectangle.
-        if options['export']['crop-to-view']:
-            me._crop_layers_to_view()
+        # The bounding boxes are computed up front and in order, since
+        # the auto-crop bbox is shared between the layers.
+        bboxes = [layer.get_bbox() for layer in me.layers]
+        # Layers that haven't changed since the last time are restored from
+        # the feature cache, and skip all the following stages.
+        keys = None
+        if featureCache is not None:
+            keys = me._get_cache_keys(bboxes)
+            me._restore_cached_layers(keys)
+
+        # Load all features that could be visible in each layer, then join, cull
+        # and crop them to the view. Layers don't depend on each other until they
+        # are simplified, so this may run in several threads (*export.threads*).
+        me._prepare_layers(bboxes, keys)
         # Here's where we apply the simplification to geometries.
-        me._simplify_layers()
+        with stats.measure('simplify') as m:
+            total, kept = me._simplify_layers()
+            m.record['input-vertices'] = total
+            m.record['vertices'] = kept
+        for layer in me.layers:
+            if layer.simplify_stats is not None:
+                stats.count('simplify', layer)
+        # Remember the simplified features, so resimplify() can restore them
+        # before cropping and subtracting again.
+        me._layer_features = [(layer, list(layer.features)) for layer in me.layers]
+        me._unsimplified_geoms = [(feature, feature.geometry) for layer in me.layers
+            for feature in layer.features
+            if layer.options['simplify'] is False or not feature.is_simplifyable()]
         # Also we can crop layers to another layer, useful if we need to limit geological
         # geometries such as tree coverage to a political boundary of a country.
         me._crop_layers()
@@ -74,35 +114,43 @@ class Map(object):
         # from political boundaries.
         me._subtract_layers()
 
+        if keys is not None:
+            for layer in me.layers:
+                final_key = keys[layer.id][1]
+                if layer.id not in me._cached_layers and final_key is not None:
+                    featureCache[final_key] = copy_features(layer.features)
+
     def _init_projection(self):
         """
         ### Initializing the map projection
         """
-        opts = self.options
+        # The map options may be shared by several maps, so the resolved
+        # projection configuration is kept in self.proj_options instead.
+        proj_opts = self.proj_options = dict(self.options['proj'])
         # If either *lat0* or *lon0* were set to "auto", we need to
         # compute a nice center of the projection and update the
         # projection configuration.
-        autoLon = 'lon0' in opts['proj'] and opts['proj']['lon0'] == 'auto'
-        autoLat = 'lat0' in opts['proj'] and opts['proj']['lat0'] == 'auto'
+        autoLon = 'lon0' in proj_opts and proj_opts['lon0'] == 'auto'
+        autoLat = 'lat0' in proj_opts and proj_opts['lat0'] == 'auto'
         if autoLon or autoLat:
             map_center = self.__get_map_center()
             if autoLon:
-                opts['proj']['lon0'] = map_center[0]
+                proj_opts['lon0'] = map_center[0]
             if autoLat:
-                opts['proj']['lat0'] = map_center[1]
+                proj_opts['lat0'] = map_center[1]
 
         # Load the projection class, if the id is known.
-        if opts['proj']['id'] in projections:
-            projC = projections[opts['proj']['id']]
+        if proj_opts['id'] in projections:
+            projC = projections[proj_opts['id']]
         else:
-            raise KartographError('projection unknown %s' % opts['proj']['id'])
+            raise KartographError('projection unknown %s' % proj_opts['id'])
         # Populate a dictionary of projection properties that
         # will be passed to the projection constructor as keyword
         # arguments.
         p_opts = {}
-        for prop in opts['proj']:
+        for prop in proj_opts:
             if prop != "id":
-                p_opts[prop] = opts['proj'][prop]
+                p_opts[prop] = proj_opts[prop]
         return projC(**p_opts)
 
     def __get_map_center(self):
@@ -194,7 +242,8 @@ class Map(object):
             if len(features) > 0:
                 for feature in features:
                     ubbox.join(geom_to_bbox(feature.geometry))
-                    feature.project(proj)
+                self.project_features(features)
+                for feature in features:
                     fbbox = geom_to_bbox(feature.geometry, data["min-area"])
                     bbox.join(fbbox)
                 # Save the unprojected bounding box for later to
@@ -210,6 +259,39 @@ class Map(object):
         # we need it for clipping tasks.
         return bbox_to_polygon(bbox)
 
+    def project_features(self, features):
+        """
+        projects features to the map projection. every geometry is only
+        projected once, even if it is loaded for the map bounds and for
+        the layer itself, or by another map using the same projection
+        """
+        cache = self._projected_geoms
+        for feature in features:
+            if feature.geometry is None:
+                feature.project(self.proj)
+                continue
+            key = sha1(feature.geometry.wkb).digest()
+            if key in cache:
+                feature.geometry = cache[key]
+            else:
+                feature.project(self.proj)
+                cache[key] = feature.geometry
+
+    def _get_projection_cache(self):
+        """
+        returns the cached geometries for the projection of this map
+        """
+        caches = self._projection_cache
+        if caches is None:
+            return {}
+        key = options_key(self.proj_options)
+        if key not in caches:
+            # Forget the projection that has been added first.
+            while len(caches) >= max_cached_projections:
+                del caches[next(iter(caches))]
+            caches[key] = {}
+        return caches[key]
+
     def _get_bounding_geometry(self):
         """
         ### Get bounding geometry
@@ -289,7 +371,10 @@ class Map(object):
             h = w / ratio
         elif w == "auto":
             w = h * ratio
-        return View(bbox, w, h - 1)
+        quantize = None
+        if exp["quantize"] is not False:
+            quantize = exp["quantize"]
+        return View(bbox, w, h - 1, quantize=quantize)
 
     def _init_view_poly(self):
         """
@@ -302,90 +387,350 @@ class Map(object):
         h = self.view.height
         return Polygon([(0, 0), (0, h), (w, h), (w, 0)])
 
+    def _prepare_layers(self, bboxes, keys=None):
+        """
+        ### Load and prepare the layer features
+        """
+        from scheduler import run_tasks
+        from functools import partial
+
+        tasks = []
+        for layer, bbox in zip(self.layers, bboxes):
+            if layer.id in self._cached_layers:
+                continue
+            key = None
+            if keys is not None:
+                key = keys[layer.id][0]
+                features = self._feature_cache.get(key)
+                if features is not None:
+                    layer.features = copy_features(features)
+                    self._add_join_attributes(layer)
+                    self.stats.count('cache', layer)
+                    continue
+            # Layers reading from the same source have to wait for each other.
+            resources = [layer.id, id(layer.source)]
+            tasks.append((partial(self._prepare_layer, layer, bbox, key), resources, resources))
+        run_tasks(tasks, self.options['export']['threads'])
+
+    def _prepare_layer(self, layer, bbox, key=None):
+        """
+        runs all the stages of a layer that don't depend on other layers
+        """
+        # Load all features that could be visible in the layer. The feature geometries
+        # will be projected and transformed to screen coordinates.
+        layer.get_features(bbox=bbox)
+        # We will join polygons.
+        if layer.options['join'] is not False:
+            with self.stats.measure('join', layer):
+                self._join_features([layer])
+        # Drop features and parts of features that are too small to be seen.
+        if layer.options['min-size'] is not False:
+            with self.stats.measure('cull', layer):
+                self._cull_layers([layer])
+        # Eventually we crop geometries to the map bounding rectangle.
+        if self.options['export']['crop-to-view']:
+            with self.stats.measure('crop-to-view', layer):
+                self._crop_layers_to_view([layer])
+        if key is not None:
+            self._feature_cache[key] = copy_features(layer.features)
+
+    def _get_cache_keys(self, bboxes):
+        """
+        returns the feature cache keys of every layer, as a tuple of the key
+        of the prepared features, the key of the final features and the ids
+        of the layers it is connected to. the keys are None for layers that
+        can't be cached
+        """
+        view = self.view
+        # The keys include everything the features depend on, but nothing
+        # that is only needed for rendering, such as the export rounding.
+        map_key = options_key([self.proj_options, self.bounds_poly.wkb,
+            view.width, view.height, self.options['export']['quantize'],
+            self.options['export']['crop-to-view']])
+
+        prepared = {}
+        for layer, bbox in zip(self.layers, bboxes):
+            src = source_key(layer.options)
+            if src is None:
+                prepared[layer.id] = None
+            else:
+                prepared[layer.id] = cache_key('prepared', map_key, options_key(layer.options),
+                    src, options_key([bbox[i] for i in range(4)]))
+
+        # Simplified layers share their topology, crop-to and subtract-from
+        # combine two layers. Layers connected in one of these ways are
+        # cached (and recomputed) together.
+        groups = dict((layer.id, set([layer.id])) for layer in self.layers)
+
+        def connect(a, b):
+            if b in groups and groups[a] is not groups[b]:
+                group = groups[a] | groups[b]
+                for layer_id in group:
+                    groups[layer_id] = group
+
+        simplified = [layer.id for layer in self.layers if layer.options['simplify'] is not False]
+        for layer_id in simplified[1:]:
+            connect(simplified[0], layer_id)
+        for layer in self.layers:
+            if layer.options['crop-to'] is not False:
+                connect(layer.id, layer.options['crop-to'])
+            for other in layer.options['subtract-from'] or []:
+                connect(layer.id, other)
+
+        keys = {}
+        for layer in self.layers:
+            members = [prepared[other.id] for other in self.layers if other.id in groups[layer.id]]
+            if None in members:
+                final = None
+            else:
+                final = cache_key('final', layer.id, *members)
+            keys[layer.id] = (prepared[layer.id], final, groups[layer.id])
+        return keys
+
+    def _restore_cached_layers(self, keys):
+        """
+        restores the final features of layers from the feature cache, if
+        all layers they are connected to are cached, too
+        """
+        cache = self._feature_cache
+        cached = {}
+        for layer in self.layers:
+            cached[layer.id] = cache.get(keys[layer.id][1])
+        for layer in self.layers:
+            # Connected layers are stored together, but the cache may have
+            # dropped some of them since.
+            if None not in [cached[other] for other in keys[layer.id][2]]:
+                layer.features = copy_features(cached[layer.id])
+                self._add_join_attributes(layer)
+                self._cached_layers.add(layer.id)
+                self.stats.count('cache', layer)
+
     def _simplify_layers(self):
         """
         ### Simplify geometries
         """
-        from simplify import create_point_store, simplify_lines
-
-        # We will use a glocal point cache for all layers. If the
-        # same point appears in more than one layer, it will be
-        # simplified only once.
-        point_store = create_point_store()
+        from simplify import Topology, topology_key, rank_lines
 
-        # Compute topology for all layers. That means that every point
-        # is checked for duplicates, and eventually replaced with
-        # an existing instance.
+        features = []
         for layer in self.layers:
-            if layer.options['simplify'] is not False:
+            if layer.options['simplify'] is not False and layer.id not in self._cached_layers:
+                settings = (layer.options['unify-precision'],
+                    layer.options['simplify']['method'], layer.options['simplify']['ranked'])
                 for feature in layer.features:
                     if feature.is_simplifyable():
-                        feature.compute_topology(point_store, layer.options['unify-precision'])
+                        features.append((feature, settings, layer))
+
+        # The topology only depends on the geometries, so if we already
+        # computed it for the very same features we can skip right to the
+        # simplification.
+        key = None
+        topology = None
+        if self._topology_cache is not None:
+            key = topology_key([(feature, settings) for feature, settings, layer in features])
+            topology = self._topology_cache.get(key)
+
+        if topology is None:
+            # We will use a glocal point cache for all layers. If the
+            # same point appears in more than one layer, it will be
+            # simplified only once.
+            topology = Topology()
+            # Compute topology for all layers. That means that every point
+            # is checked for duplicates, and eventually replaced with
+            # the id of an existing point.
+            for feature, settings, layer in features:
+                topology.add_feature(feature, layer.options['unify-precision'])
+            # Now we break features into arcs, which makes them easier
+            # to simplify.
+            topology.build()
+            topology.attach([feature for feature, settings, layer in features])
+            # For layers using ranked simplification we compute the rank
+            # of every point once, so they can be simplified to any
+            # tolerance later on.
+            for feature, settings, layer in features:
+                if layer.options['simplify']['ranked']:
+                    rank_lines(feature._topology_lines, topology.point_store, layer.options['simplify']['method'])
+            if key is not None:
+                self._topology_cache[key] = topology
+        else:
+            topology.attach([feature for feature, settings, layer in features])
 
-        # Now we break features into line segments, which makes them
-        # easier to simplify.
+        self._point_store = topology.point_store
+        return self._apply_simplification()
+
+    def _apply_simplification(self, tolerance=None):
+        """
+        applies the line simplification to the topology computed in
+        _simplify_layers(), using either the tolerance of each layer
+        or the given tolerance
+        """
+        from simplify import simplify_jobs, collapse_lines
+        from itertools import izip
+
+        point_store = self._point_store
+        point_store.reset_simplification()
+
+        features = []
+        jobs = []
+        stats = {}
         for layer in self.layers:
-            if layer.options['simplify'] is not False:
+            if layer.options['simplify'] is not False and layer.id not in self._cached_layers:
+                method = layer.options['simplify']['method']
+                tol = tolerance
+                if tol is None:
+                    tol = self._get_simplify_tolerance(layer)
+                collapsed = 0
                 for feature in layer.features:
                     if feature.is_simplifyable():
-                        feature.break_into_lines()
+                        if layer.options['simplify']['tolerance'] == 'auto':
+                            # Lines that are smaller than a pixel are
+                            # collapsed right away.
+                            collapsed += collapse_lines(feature._topology_lines, point_store, 1.0)
+                        features.append((feature, layer))
+                        jobs.append((feature._topology_lines, method, tol, layer.options['simplify']['ranked']))
+                stats[layer.id] = [0, 0, collapsed]
 
         # Finally, apply the chosen line simplification algorithm.
+        results = simplify_jobs(jobs, point_store, self.options['export']['processes'])
         total = 0
         kept = 0
+        deleted = point_store.deleted
+        for (feature, layer), lines in izip(features, results):
+            layer_stats = stats[layer.id]
+            for line in lines:
+                layer_stats[0] += len(line)
+                for pt in line:
+                    if not deleted[pt]:
+                        layer_stats[1] += 1
+            # ..and restore the geometries from the simplified line segments.
+            feature.restore_geometry(lines, layer.options['filter-islands'])
+
+        # We keep track of the number of points per layer.
         for layer in self.layers:
-            if layer.options['simplify'] is not False:
-                for feature in layer.features:
-                    if feature.is_simplifyable():
-                        lines = feature.break_into_lines()
-                        lines = simplify_lines(lines, layer.options['simplify']['method'], layer.options['simplify']['tolerance'])
-                        for line in lines:
-                            total += len(line)
-                            for pt in line:
-                                if not pt.deleted:
-                                    kept += 1
-                        # ..and restore the geometries from the simplified line segments.
-                        feature.restore_geometry(lines, layer.options['filter-islands'])
+            if layer.id in stats:
+                layer.simplify_stats = tuple(stats[layer.id])
+                total += stats[layer.id][0]
+                kept += stats[layer.id][1]
+                if verbose:
+                    sys.stderr.write('simplified layer %s: %d of %d points kept (%.1f%% removed), %d lines collapsed\n' % (
+                        layer.id, layer.simplify_stats[1], layer.simplify_stats[0],
+                        100.0 - 100.0 * layer.simplify_stats[1] / max(1, layer.simplify_stats[0]),
+                        layer.simplify_stats[2]))
         return (total, kept)
 
-    def _crop_layers_to_view(self):
+    def _get_simplify_tolerance(self, layer):
+        """
+        returns the simplification tolerance of a layer. the features
+        have already been transformed to the map view, so the tolerance
+        is measured in pixels of the output map. in auto mode it
+        is set to the maximum error in pixels
+        """
+        opts = layer.options['simplify']
+        if opts['tolerance'] != 'auto':
+            return opts['tolerance']
+        return opts['max-error']
+
+    def resimplify(self, tolerance=None):
+        """
+        simplifies the map again using a different tolerance without
+        recomputing the topology, and re-applies crop-to and
+        subtract-from. this is a cheap threshold filter for layers that
+        use ranked simplification, so several versions of a map can be
+        rendered from one topology
+        """
+        if len(self._cached_layers) > 0:
+            raise KartographError('resimplify() needs the topology of all layers, '
+                + 'which is not available for layers restored from the feature cache')
+        for layer, features in self._layer_features:
+            layer.features = list(features)
+        for feature, geom in self._unsimplified_geoms:
+            feature.geometry = geom
+        result = self._apply_simplification(tolerance)
+        self._crop_layers()
+        self._subtract_layers()
+        return result
+
+    def _cull_layers(self, layers):
+        """
+        removes polygons, holes and lines that are smaller than the
+        min-size of their layer (in pixels), before they go through
+        clipping and simplification
+        """
+        for layer in layers:
+            min_size = layer.options['min-size']
+            if min_size is False:
+                continue
+            features = []
+            stats = dict(features=0, parts=0, holes=0)
+            for feature in layer.features:
+                culled = feature.geom is not None and not feature.geom.is_empty
+                parts, holes = feature.cull(min_size)
+                stats['parts'] += parts
+                stats['holes'] += holes
+                if feature.geom is None:
+                    # only count the features that have been culled away
+                    if culled:
+                        stats['features'] += 1
+                else:
+                    features.append(feature)
+            layer.features = features
+            layer.cull_stats = stats
+            if verbose:
+                sys.stderr.write('culled layer %s: removed %d features, %d parts and %d holes\n' % (
+                    layer.id, stats['features'], stats['parts'], stats['holes']))
+
+    def _crop_layers_to_view(self, layers):
         """
         cuts the layer features to the map view
         """
-        for layer in self.layers:
-            #out = []
+        # The view is always an axis-aligned rectangle, so we can use the
+        # fast rectangle clipper instead of a general intersection.
+        bbox = geom_to_bbox(self.view_poly)
+        for layer in layers:
             for feat in layer.features:
-                if not feat.geometry.is_valid:
-                    pass
-                    #print feat.geometry
-                    #_plot_geometry(feat.geometry)
-                feat.crop_to(self.view_poly)
-                #if not feat.is_empty():
-                #    out.append(feat)
-            #layer.features = out
+                feat.crop_to_bbox(bbox)
 
     def _crop_layers(self):
         """
         handles crop-to
         """
+        from scheduler import run_tasks
+        from functools import partial
+
+        tasks = []
         for layer in self.layers:
-            if layer.options['crop-to'] is not False:
-                cropped_features = []
-                for tocrop in layer.features:
-                    cbbox = geom_to_bbox(tocrop.geom)
-                    crop_at_layer = layer.options['crop-to']
-                    if crop_at_layer not in self.layersById:
-                        raise KartographError('you want to substract '
-                            + 'from layer "%s" which cannot be found'
-                            % crop_at_layer)
-                    for crop_at in self.layersById[crop_at_layer].features:
-                        # Sometimes a bounding box may not exist, so get it
-                        if not hasattr(crop_at.geom,'bbox'):
-                            crop_at.geom.bbox = geom_to_bbox(crop_at.geom)
-                        if crop_at.geom.bbox.intersects(cbbox):
-                            tocrop.crop_to(crop_at.geom)
-                            cropped_features.append(tocrop)
-                layer.features = cropped_features
+            if layer.options['crop-to'] is not False and layer.id not in self._cached_layers:
+                crop_at_layer = layer.options['crop-to']
+                if crop_at_layer not in self.layersById:
+                    raise KartographError('you want to substract '
+                        + 'from layer "%s" which cannot be found'
+                        % crop_at_layer)
+                # Layers cropped to different layers can be cropped at the same time.
+                tasks.append((partial(self._crop_layer, layer, crop_at_layer),
+                    [layer.id, crop_at_layer], [layer.id]))
+        run_tasks(tasks, self.options['export']['threads'])
+
+    def _crop_layer(self, layer, crop_at_layer):
+        """
+        crops the features of a layer to the features of another layer
+        """
+        with self.stats.measure('crop-to', layer):
+            index = self._get_layer_index(crop_at_layer)
+            cropped_features = []
+            for tocrop in layer.features:
+                if tocrop.geom is None:
+                    continue
+                crop_at = self._intersecting_geoms(tocrop.geom, index)
+                if len(crop_at) == 0:
+                    continue
+                # We crop to all intersecting features at once. Invalid
+                # features are ignored, like crop_to() does, so a feature
+                # that only meets invalid ones isn't cropped at all.
+                valid = [geom for geom, is_valid in crop_at if is_valid]
+                if len(valid) > 0:
+                    tocrop.crop_to_all(valid)
+                if tocrop.geom is not None:
+                    cropped_features.append(tocrop)
+            layer.features = cropped_features
 
     def _subtract_layers(self):
         """
@@ -394,26 +739,76 @@ class Map(object):
         # Substract geometry of a layer from the geometry
         # of one or more different layers. Added mainly
         # for excluding great lakes from country polygons.
+        from scheduler import run_tasks
+        from functools import partial
+
+        tasks = []
         for layer in self.layers:
-            if layer.options['subtract-from']:
-                for feat in layer.features:
-                    if feat.geom is None:
+            if layer.options['subtract-from'] and layer.id not in self._cached_layers:
+                for subid in layer.options['subtract-from']:
+                    if subid not in self.layersById:
+                        raise KartographError('you want to subtract'
+                            + ' from layer "%s" which cannot be found'
+                            % subid)
+                tasks.append((partial(self._subtract_layer, layer), [layer.id],
+                    [layer.id] + list(layer.options['subtract-from'])))
+        run_tasks(tasks, self.options['export']['threads'])
+
+    def _subtract_layer(self, layer):
+        """
+        subtracts the features of a layer from the layers in its subtract-from
+        """
+        with self.stats.measure('subtract', layer) as m:
+            index = self._get_layer_index(layer.id)
+            # We remove it from multiple layers, if wanted.
+            for subid in layer.options['subtract-from']:
+                for s in self.layersById[subid].features:
+                    if s.geom is None:
                         continue
-                    cbbox = geom_to_bbox(feat.geom)
-                    # We remove it from multiple layers, if wanted.
-                    for subid in layer.options['subtract-from']:
-                        if subid not in self.layersById:
-                            raise KartographError('you want to subtract'
-                                + ' from layer "%s" which cannot be found'
-                                % subid)
-                        for s in self.layersById[subid].features:
-                            if s.geom and geom_to_bbox(s.geom).intersects(cbbox):
-                                s.subtract_geom(feat.geom)
-                # Finally, we don't want the subtracted features
-                # to be included in our map.
-                layer.features = []
-
-    def _join_features(self):
+                    geoms = self._intersecting_geoms(s.geom, index)
+                    # All valid intersecting features are subtracted at once.
+                    valid = [geom for geom, is_valid in geoms if is_valid]
+                    if len(valid) > 0:
+                        s.subtract_geom(union_geometries(valid))
+                    # Invalid ones can't be merged, so they are subtracted
+                    # one by one.
+                    for geom, is_valid in geoms:
+                        if not is_valid:
+                            s.subtract_geom(geom)
+            # We count the features we subtracted from.
+            m.count([s for subid in layer.options['subtract-from']
+                for s in self.layersById[subid].features])
+        # Finally, we don't want the subtracted features
+        # to be included in our map.
+        layer.features = []
+
+    def _get_layer_index(self, layer_id):
+        """
+        returns a spatial index of the geometries of a layer, along with
+        whether they are valid
+        """
+        return GridIndex([(feature.geom.bounds, (feature.geom, feature.geom.is_valid))
+            for feature in self.layersById[layer_id].features
+            if feature.geom is not None])
+
+    def _intersecting_geoms(self, geom, index):
+        """
+        returns all (geometry, is_valid) tuples in a spatial index whose
+        geometries intersect geom
+        """
+        candidates = index.query(geom.bounds)
+        if len(candidates) == 0:
+            return candidates
+        if not geom.is_valid:
+            # prepared geometries can't handle invalid geometries,
+            # so we fall back to the bounding boxes
+            return candidates
+        prepared = prep(geom)
+        # the same goes for invalid candidates
+        return [(c, is_valid) for c, is_valid in candidates
+            if not is_valid or prepared.intersects(c)]
+
+    def _join_features(self, layers):
         """
         ### Joins features within a layer.
 
@@ -423,8 +818,9 @@ class Map(object):
         """
         from geometry.utils import join_features
 
-        for layer in self.layers:
+        for layer in layers:
             if layer.options['join'] is not False:
+                self._add_join_attributes(layer)
                 unjoined = 0
                 join = layer.options['join']
                 # The property we want to group the features by.
@@ -444,6 +840,20 @@ class Map(object):
                 if groupBy is False:
                     groupFeatures[layer.id] = []
                     groups = [layer.id]
+                else:
+                    for g_id in groups:
+                        groupFeatures[g_id] = []
+                    # We look up the group of each value in a dictionary,
+                    # instead of searching through all groups. If a value
+                    # belongs to more than one group, the first one wins.
+                    groupIndex = {}
+                    for i, g_id in enumerate(groups):
+                        values = groups[g_id]
+                        if isinstance(values, basestring):
+                            values = [values]
+                        for value in values:
+                            if value not in groupIndex:
+                                groupIndex[value] = (i, g_id)
 
                 res = []
                 # Find all features for each group.
@@ -451,15 +861,18 @@ class Map(object):
                     if groupBy is False:
                         groupFeatures[layer.id].append(feat)
                     else:
-                        found_in_group = False
-                        for g_id in groups:
-                            if g_id not in groupFeatures:
-                                groupFeatures[g_id] = []
-                            if feat.props[groupBy] in groups[g_id] or str(feat.props[groupBy]) in groups[g_id]:
-                                groupFeatures[g_id].append(feat)
-                                found_in_group = True
-                                break
-                        if not found_in_group:
+                        value = feat.props[groupBy]
+                        group = groupIndex.get(value)
+                        try:
+                            # the group values may be given as strings
+                            str_group = groupIndex.get(str(value))
+                        except UnicodeEncodeError:
+                            str_group = None
+                        if group is None or (str_group is not None and str_group[0] < group[0]):
+                            group = str_group
+                        if group is not None:
+                            groupFeatures[group[1]].append(feat)
+                        else:
                             unjoined += 1
                             res.append(feat)
 
@@ -491,14 +904,10 @@ class Map(object):
                     if 'attributes' in join:
                         attrs = join['attributes']
                         for key in attrs:
-                            if key not in layer.options['attributes']:
-                                # add key to layer attributes to ensure
-                                # that it's being included in SVG
-                                layer.options['attributes'].append({'src': key, 'tgt': key})
                             if isinstance(attrs[key], dict):
                                 if g_id in attrs[key]:
                                     props[key] = attrs[key][g_id]
-                            else:
+                            elif len(groupFeatures[g_id]) > 0:
                                 props[key] = groupFeatures[g_id][0].props[attrs[key]]  # use first value
 
                     # Finally join (union) the feature geometries.
@@ -521,6 +930,19 @@ class Map(object):
 
                 layer.features = res
 
+    def _add_join_attributes(self, layer):
+        """
+        adds the attributes defined for joined features to the layer
+        attributes, to ensure that they are being included in SVG
+        """
+        if layer.options['join'] is False or 'attributes' not in layer.options['join']:
+            return
+        if layer.attributes == 'all':
+            return
+        for key in layer.options['join']['attributes']:
+            if key not in layer.attributes:
+                layer.attributes.append({'src': key, 'tgt': key})
+
     def compute_map_scale(me):
         """
         computes the width of the map (at the lower boundary) in projection units (typically meters)
@@ -1,6 +1,7 @@
 
 from layersource import handle_layer_source
 from filter import filter_record
+from geometry import BBox
 
 
 _verbose = False
@@ -21,12 +22,23 @@ class MapLayer(object):
         self.options = options
         self.map = _map
         self.cache = cache
+        # Number of points before and after simplification, and the number
+        # of collapsed lines, see Map._apply_simplification().
+        self.simplify_stats = None
+        # Number of features, parts and holes removed by min-size.
+        self.cull_stats = None
         if 'class' not in options:
             self.classes = []
         elif isinstance(options['class'], basestring):
             self.classes = options['class'].split(' ')
         elif isinstance(options['class'], list):
             self.classes = options['class']
+        # The attributes to include in the output. Joins may add more, so
+        # this is a copy of the attributes option.
+        if options['attributes'] == 'all':
+            self.attributes = 'all'
+        else:
+            self.attributes = list(options['attributes'])
         # Make sure that the layer id is unique within the map.
         while self.id in self.map.layersById:
             self.id += "_"
@@ -34,13 +46,12 @@ class MapLayer(object):
         # geo data such as shapefiles or virtual sources such as graticule lines.
         self.source = handle_layer_source(self.options, self.cache)
 
-    def get_features(layer, filter=False, min_area=0):
+    def get_bbox(layer):
         """
-        ### get_features()
-        Returns a list of projected and filtered features of a layer.
+        ### get_bbox()
+        Returns the bounding box (in lat/lon) used for loading the features.
         """
         opts = layer.map.options
-        is_projected = False
 
         # Let's see if theres a better bounding box than this..
         bbox = [-180, -90, 180, 90]
@@ -54,7 +65,10 @@ class MapLayer(object):
             # will use the actual bounding geometry to compute the bounding box
             if opts['bounds']['crop'] == "auto":
                 if layer.map._unprojected_bounds:
-                    bbox = layer.map._unprojected_bounds
+                    # The bounds are shared by all layers, so every layer
+                    # inflates its own copy.
+                    bbox = BBox()
+                    bbox.join(layer.map._unprojected_bounds)
                     bbox.inflate(inflate=opts['bounds']['padding'] * 2)
                 elif _verbose:
                     pass
@@ -63,6 +77,45 @@ class MapLayer(object):
                 # otherwise it will use the user defined bbox in the format
                 # [minLon, minLat, maxLon, maxLat]
                 bbox = opts['bounds']['crop']
+        return bbox
+
+    def get_features(layer, filter=False, min_area=0, bbox=None):
+        """
+        ### get_features()
+        Returns a list of projected and filtered features of a layer.
+        """
+        if bbox is None:
+            bbox = layer.get_bbox()
+        stats = layer.map.stats
+
+        with stats.measure('load', layer) as m:
+            features, is_projected = layer._load_features(bbox)
+            m.count(features)
+
+        # If the features are not projected yet, we project them now.
+        if not is_projected:
+            with stats.measure('project', layer) as m:
+                layer.map.project_features(features)
+                m.count(features)
+
+        with stats.measure('view', layer) as m:
+            # Transform features to view coordinates.
+            for feature in features:
+                feature.project_view(layer.map.view)
+
+            # Remove features that don't intersect our clipping polygon
+            if layer.map.view_poly:
+                features = [feature for feature in features
+                if feature.geometry and feature.geometry.intersects(layer.map.view_poly)]
+            m.count(features)
+        layer.features = features
+
+    def _load_features(layer, bbox):
+        """
+        loads the features of a layer from its source, returns the features
+        and whether they are projected already
+        """
+        is_projected = False
 
         # If the layer has the "src" property, it is a **regular map layer** source, which
         # means that there's an exernal file that we load the geometry and meta data from.
@@ -99,15 +152,4 @@ class MapLayer(object):
                 features = layer.source.get_features(layer.map.proj)
                 is_projected = True
 
-        for feature in features:
-            # If the features are not projected yet, we project them now.
-            if not is_projected:
-                feature.project(layer.map.proj)
-            # Transform features to view coordinates.
-            feature.project_view(layer.map.view)
-
-        # Remove features that don't intersect our clipping polygon
-        if layer.map.view_poly:
-            features = [feature for feature in features
-            if feature.geometry and feature.geometry.intersects(layer.map.view_poly)]
-        layer.features = features
+        return features, is_projected
@@ -1,4 +1,3 @@
-
 import tinycss
 
 
@@ -8,8 +7,13 @@ class MapStyle(object):
         if css:
             parser = tinycss.make_parser()
             self.css = parser.parse_stylesheet(css)
+            # The stylesheet is compiled once, and the rules that could
+            # apply to a layer are looked up once per layer.
+            self._rules = [_compile_rule(rule) for rule in self.css.rules]
         else:
             self.css = None
+            self._rules = []
+        self._layers = {}
 
     def getStyle(self, layer_id, layer_classes=[], fprops=dict()):
         """
@@ -17,21 +21,16 @@ class MapStyle(object):
         """
         if self.css is None:
             return {}
-        attrs = dict()
-        for rule in self.css.rules:
-            # Find out whether this rule matches
-            if _checkRule(layer_id, layer_classes, fprops, rule):
-                for decl in rule.declarations:
-                    prop = ''
-                    for val in decl.value:
-                        if val.type == 'INTEGER':
-                            prop += str(val.value)
-                        elif val.type == 'DIMENSION':
-                            prop += str(val.value) + val.unit
-                        else:
-                            prop += str(val.value)
-                    attrs[decl.name] = prop
-        return attrs
+        return dict(self._get_layer(layer_id, layer_classes).get_style(fprops))
+
+    def getFeatureStyle(self, layer_id, layer_classes, fprops):
+        """
+        Returns the style rules for a given feature that differ from the
+        style of its layer.
+        """
+        if self.css is None:
+            return {}
+        return self._get_layer(layer_id, layer_classes).get_feature_style(fprops)
 
     def applyStyle(self, node, layer_id, layer_classes=[], fprops=dict()):
         style = self.getStyle(layer_id, layer_classes, fprops)
@@ -40,14 +39,98 @@ class MapStyle(object):
         return style
 
     def applyFeatureStyle(self, node, layer_id, layer_classes, fprops=dict()):
-        layer_style = self.getStyle(layer_id, layer_classes)
-        feat_style = self.getStyle(layer_id, layer_classes, fprops)
-        feat_style = style_diff(feat_style, layer_style)
+        feat_style = self.getFeatureStyle(layer_id, layer_classes, fprops)
         for key in feat_style:
             node.setAttribute(key, feat_style[key])
 
+    def _get_layer(self, layer_id, layer_classes):
+        key = (layer_id, tuple(layer_classes))
+        if key not in self._layers:
+            self._layers[key] = _LayerStyle(self._rules, layer_id, layer_classes)
+        return self._layers[key]
+
+
+class _LayerStyle(object):
+    """
+    the rules of a stylesheet that could apply to the features of one
+    layer, in the order of the stylesheet. Feature styles are memoized
+    by the values of the feature properties referenced by the rules.
+    """
+
+    def __init__(self, rules, layer_id, layer_classes):
+        self.rules = []
+        keys = set()
+        for declarations, parts in rules:
+            alternatives = [conditions for head, conditions in parts
+                if _match_head(head, layer_id, layer_classes)]
+            if len(alternatives) == 0:
+                continue
+            self.rules.append((declarations, alternatives))
+            for conditions in alternatives:
+                for cond in conditions:
+                    if cond[0] == 'attr':
+                        keys.add(cond[1])
+        self.keys = sorted(keys)
+        self.layer_style = self._get_style({})
+        self._memo = {}
+
+    def get_style(self, fprops):
+        if len(fprops) == 0 or len(self.keys) == 0:
+            return self.layer_style
+        return self._memoize(fprops)[0]
+
+    def get_feature_style(self, fprops):
+        if len(fprops) == 0 or len(self.keys) == 0:
+            return {}
+        return self._memoize(fprops)[1]
+
+    def _memoize(self, fprops):
+        key = []
+        for k in self.keys:
+            if k in fprops:
+                val = fprops[k]
+                # the type is part of the key, so 1 and '1' don't mix up
+                key.append((True, val.__class__, val))
+            else:
+                key.append((False,))
+        key = tuple(key)
+        try:
+            return self._memo[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # unhashable property values
+            style = self._get_style(fprops)
+            return style, style_diff(style, self.layer_style)
+        style = self._get_style(fprops)
+        self._memo[key] = res = style, style_diff(style, self.layer_style)
+        return res
+
+    def _get_style(self, fprops):
+        attrs = dict()
+        for declarations, alternatives in self.rules:
+            if _match_alternatives(alternatives, fprops):
+                attrs.update(declarations)
+        return attrs
+
+
+def _compile_rule(rule):
+    """
+    compiles a tinycss rule into its declarations, as a list of (name,
+    value) tuples, and the parts of its selector
+    """
+    declarations = []
+    for decl in rule.declarations:
+        prop = ''
+        for val in decl.value:
+            if val.type == 'INTEGER':
+                prop += str(val.value)
+            elif val.type == 'DIMENSION':
+                prop += str(val.value) + val.unit
+            else:
+                prop += str(val.value)
+        declarations.append((decl.name, prop))
 
-def _checkRule(layer_id, layer_classes, fprops, rule):
     parts = [[]]
     k = 0
     for sel in rule.selector:
@@ -60,75 +143,112 @@ def _checkRule(layer_id, layer_classes, fprops, rule):
             parts.append([])
             continue
         parts[k].append(sel)
+    return declarations, [_compile_part(p, rule) for p in parts if len(p) > 0]
 
-    for p in parts:
-        if len(p) > 0:
-            o = _checkIdAndClass(p, layer_id, layer_classes)
-            if o > 0:
-                if len(p) == 1:
-                    return True
-                else:
-                    match = True
-                    for r in p[o:]:
-                        if r.type == '[' and r.content[0].type == 'IDENT' and r.content[len(r.content) - 1].type in ('IDENT', 'INTEGER'):
-                            key = r.content[0].value
-                            val = r.content[len(r.content) - 1].value
-                            comp = ''
-                            for c in r.content[1:len(r.content) - 1]:
-                                if c.type == 'DELIM':
-                                    comp += c.value
-                                else:
-                                    raise ValueError('problem while parsing map stylesheet at ' + rule.selector.as_css())
-                            if key not in fprops:
-                                match = False
-                            else:
-                                if comp == '=':
-                                    match = match and fprops[key] == val
-                                elif comp == '~=':
-                                    vals = val.split(' ')
-                                    match = match and fprops[key] in vals
-                                elif comp == '|=':
-                                    # Matches if the attribute begins with the value
-                                    # Note that this is a slightly different interpretation than
-                                    # the one used in the CSS specs, since we don't require the '-'
-                                    match = match and fprops[key][:len(val)] == val
-                                elif comp == '=|':
-                                    # Matches if the attribute ends with the value
-                                    match = match and fprops[key][-len(val):] == val
-                                elif comp == '>':
-                                    match = match and fprops[key] > val
-                                elif comp == '>=':
-                                    match = match and fprops[key] >= val
-                                elif comp == '<':
-                                    match = match and fprops[key] < val
-                                elif comp == '<=':
-                                    match = match and fprops[key] <= val
-                        else:
-                            # print r
-                            match = False
-                    if match is True:
-                        return True
-
-
-def _checkIdAndClass(part, layer_id, layer_classes):
+
+def _compile_part(part, rule):
     """
-    checks wether the part of a css rule matches a given layer id
-    and/or a list of classes
+    compiles a comma-separated part of a selector into a layer id or
+    class to match (the head), and a list of conditions on the feature
+    properties
     """
     # Match layer id
-    if part[0].type == 'HASH' and part[0].value[1:] == layer_id:
-        return 1
+    if part[0].type == 'HASH':
+        head = ('id', part[0].value[1:])
+        o = 1
     # Match wildcard *
-    if part[0].type == 'DELIM' and part[0].value == '*':
-        return 1
+    elif part[0].type == 'DELIM' and part[0].value == '*':
+        head = ('*',)
+        o = 1
     # Match class name
-    if part[0].type == 'DELIM' and part[0].value == '.':
+    elif part[0].type == 'DELIM' and part[0].value == '.' and len(part) > 1 and part[1].type == 'IDENT':
         # We only test the first class, so .foo.bar would match
         # any layer with the class 'foo' regardless of it also has
         # the class 'bar'
-        if part[1].type == 'IDENT' and part[1].value in layer_classes:
-            return 2
-    return 0
+        head = ('class', part[1].value)
+        o = 2
+    else:
+        return (None,), []
+    conditions = []
+    for r in part[o:]:
+        if r.type == '[' and r.content[0].type == 'IDENT' and r.content[len(r.content) - 1].type in ('IDENT', 'INTEGER'):
+            key = r.content[0].value
+            val = r.content[len(r.content) - 1].value
+            comp = ''
+            for c in r.content[1:len(r.content) - 1]:
+                if c.type == 'DELIM':
+                    comp += c.value
+                else:
+                    # raised when the part is checked, like it used to be
+                    conditions.insert(0, ('error', 'problem while parsing map stylesheet at ' + rule.selector.as_css()))
+                    break
+            else:
+                conditions.append(('attr', key, _compile_comparison(comp, val)))
+        else:
+            conditions.append(('never',))
+    return head, conditions
+
+
+def _compile_comparison(comp, val):
+    """ returns a function that compares a property value with val """
+    if comp == '=':
+        return lambda v: v == val
+    elif comp == '~=':
+        return lambda v: v in val.split(' ')
+    elif comp == '|=':
+        # Matches if the attribute begins with the value
+        # Note that this is a slightly different interpretation than
+        # the one used in the CSS specs, since we don't require the '-'
+        return lambda v: v[:len(val)] == val
+    elif comp == '=|':
+        # Matches if the attribute ends with the value
+        return lambda v: v[-len(val):] == val
+    elif comp == '>':
+        return lambda v: v > val
+    elif comp == '>=':
+        return lambda v: v >= val
+    elif comp == '<':
+        return lambda v: v < val
+    elif comp == '<=':
+        return lambda v: v <= val
+    # unknown comparisons only check that the property exists
+    return None
+
+
+def _match_head(head, layer_id, layer_classes):
+    """
+    checks wether the part of a css rule matches a given layer id
+    and/or a list of classes
+    """
+    if head[0] == 'id':
+        return head[1] == layer_id
+    if head[0] == '*':
+        return True
+    if head[0] == 'class':
+        return head[1] in layer_classes
+    return False
+
+
+def _match_alternatives(alternatives, fprops):
+    """ checks whether any of the compiled selector parts matches """
+    for conditions in alternatives:
+        match = True
+        for cond in conditions:
+            if cond[0] == 'error':
+                raise ValueError(cond[1])
+            if cond[0] == 'never':
+                match = False
+                break
+            key, test = cond[1], cond[2]
+            if key not in fprops:
+                match = False
+                break
+            if test is not None and not test(fprops[key]):
+                match = False
+                break
+        if match:
+            return True
+    return False
 
 
 def style_diff(d1, d2):
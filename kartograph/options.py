@@ -142,6 +142,7 @@ def parse_layers(opts):
         parse_layer_simplify(layer)
         parse_layer_subtract(layer)
         parse_layer_cropping(layer)
+        parse_layer_culling(layer)
 
 
 def parse_layer_attributes(layer):
@@ -173,6 +174,8 @@ def parse_layer_labeling(layer):
         lbl['buffer'] = False
     if 'key' not in lbl:
         lbl['key'] = False
+    if 'split-at' not in lbl:
+        lbl['split-at'] = 10
 
 
 def parse_layer_filter(layer):
@@ -232,13 +235,30 @@ def parse_layer_simplify(layer):
         return
     if layer['simplify'] is False:
         return
-    if isinstance(layer['simplify'], (int, float, str, unicode)):
+    if layer['simplify'] == 'auto':
+        layer['simplify'] = {"method": "visvalingam-whyatt", "tolerance": "auto"}
+    elif isinstance(layer['simplify'], (int, float, str, unicode)):
         # default to visvalingam-whyatt
         layer['simplify'] = {"method": "visvalingam-whyatt", "tolerance": float(layer['simplify'])}
-    try:
-        layer['simplify']['tolerance'] = float(layer['simplify']['tolerance'])
-    except ValueError:
-        raise Error('could not convert simplification amount to float')
+    if 'tolerance' not in layer['simplify']:
+        layer['simplify']['tolerance'] = 'auto'
+    if layer['simplify']['tolerance'] == 'auto':
+        # the tolerance is derived from the maximum error in pixels
+        if 'max-error' not in layer['simplify']:
+            layer['simplify']['max-error'] = 0.5
+        try:
+            layer['simplify']['max-error'] = float(layer['simplify']['max-error'])
+        except ValueError:
+            raise Error('could not convert simplification max-error to float')
+    else:
+        try:
+            layer['simplify']['tolerance'] = float(layer['simplify']['tolerance'])
+        except ValueError:
+            raise Error('could not convert simplification amount to float')
+    if 'ranked' not in layer['simplify']:
+        layer['simplify']['ranked'] = False
+    if layer['simplify']['ranked'] and layer['simplify']['method'] not in ('douglas-peucker', 'visvalingam-whyatt'):
+        raise Error('ranked simplification is not supported by method "%s"' % layer['simplify']['method'])
 
 
 def parse_layer_subtract(layer):
@@ -255,6 +275,18 @@ def parse_layer_cropping(layer):
         return
 
 
+def parse_layer_culling(layer):
+    if 'min-size' not in layer:
+        layer['min-size'] = False
+        return
+    if layer['min-size'] is False:
+        return
+    try:
+        layer['min-size'] = float(layer['min-size'])
+    except ValueError:
+        raise Error('could not convert min-size to float')
+
+
 def parse_layer_graticule(layer):
     if 'latitudes' not in layer:
         layer['latitudes'] = []
@@ -370,12 +402,203 @@ def parse_export(opts):
         exp["round"] = False
     else:
         exp["round"] = int(exp["round"])
+    if "quantize" not in exp or exp["quantize"] is False:
+        exp["quantize"] = False
+    else:
+        # snap view coordinates to the grid given by round (or integers)
+        if exp["quantize"] is True:
+            exp["quantize"] = exp["round"] or 0
+        else:
+            exp["quantize"] = int(exp["quantize"])
+        if exp["round"] is False:
+            exp["round"] = exp["quantize"]
+    if "trim-zeros" not in exp:
+        # leave out trailing zeros of coordinates, e.g. 12.50 -> 12.5
+        exp["trim-zeros"] = False
+    if "relative-paths" not in exp:
+        # compact path data with relative moves, see renderer/svg.py
+        exp["relative-paths"] = False
+    if "style-classes" not in exp:
+        # share feature styles as css classes, see renderer/svg.py
+        exp["style-classes"] = False
     if "crop-to-view" not in exp:
         exp['crop-to-view'] = True
     if "scalebar" not in exp:
         exp['scalebar'] = False
     elif exp['scalebar'] is True:
         exp['scalebar'] = dict()
+    if exp['scalebar'] is not False:
+        if 'align' not in exp['scalebar']:
+            exp['scalebar']['align'] = 'bl'  # default to bottom left
+        if 'offset' not in exp['scalebar']:
+            exp['scalebar']['offset'] = 20  # 20px offset
 
     if 'prettyprint' not in exp:
         exp['prettyprint'] = False
+    if 'compression-level' not in exp:
+        # zlib's default, only used for svgz
+        exp['compression-level'] = 6
+    else:
+        try:
+            exp['compression-level'] = int(exp['compression-level'])
+        except ValueError:
+            raise Error('could not convert export compression-level to int')
+        if not 0 <= exp['compression-level'] <= 9:
+            raise Error('export compression-level must be between 0 and 9')
+    if 'streaming' not in exp:
+        # write maps to files while rendering them, see renderer/svg.py
+        exp['streaming'] = True
+    if 'processes' not in exp:
+        exp['processes'] = 1
+    else:
+        try:
+            exp['processes'] = int(exp['processes'])
+        except ValueError:
+            raise Error('could not convert export processes to int')
+    if 'threads' not in exp:
+        exp['threads'] = 1
+    else:
+        try:
+            exp['threads'] = int(exp['threads'])
+        except ValueError:
+            raise Error('could not convert export threads to int')
+
+
+class FrozenDict(OrderedDict):
+    """
+    read-only ordered dictionary used for parsed map options
+    """
+
+    def __init__(self, items=()):
+        OrderedDict.__init__(self)
+        if hasattr(items, 'items'):
+            items = items.items()
+        for key, value in items:
+            OrderedDict.__setitem__(self, key, value)
+
+    def _read_only(self, *args, **kwargs):
+        raise Error('map options are read-only, use override() to change them')
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (self.__class__, (self.items(),))
+
+
+class FrozenList(list):
+    """
+    read-only list used for parsed map options
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise Error('map options are read-only, use override() to change them')
+
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = _read_only
+    __iadd__ = __imul__ = _read_only
+    append = extend = insert = remove = pop = sort = reverse = _read_only
+
+    def __reduce__(self):
+        return (self.__class__, (list(self),))
+
+
+def freeze(obj):
+    """ returns a read-only copy of a (nested) options dictionary """
+    if isinstance(obj, (FrozenDict, FrozenList)):
+        return obj
+    if isinstance(obj, dict):
+        return FrozenDict((key, freeze(value)) for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return FrozenList(freeze(value) for value in obj)
+    return obj
+
+
+def thaw(obj):
+    """ returns a mutable copy of (nested) read-only options """
+    if isinstance(obj, dict):
+        return OrderedDict((key, thaw(value)) for key, value in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return [thaw(value) for value in obj]
+    return obj
+
+
+def _merge(base, changes):
+    """ returns base with changes merged in, copying only the changed paths """
+    if not isinstance(base, dict) or not isinstance(changes, dict):
+        return freeze(changes)
+    merged = OrderedDict(base.items())
+    for key, value in changes.items():
+        if key in merged:
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = freeze(value)
+    return FrozenDict(merged)
+
+
+class MapOptions(FrozenDict):
+    """
+    parsed and validated map options that can't be changed anymore
+
+    Passing MapOptions instead of a plain dictionary to Kartograph.generate()
+    saves copying and parsing the options for every map. Use override() to
+    get options with some of the values changed, e.g.
+
+        opts = MapOptions(config)
+        for lon0 in range(-180, 180, 30):
+            K.generate(opts.override({'proj': {'lon0': lon0}}), ...)
+    """
+
+    def __init__(self, opts, _parsed=None):
+        if _parsed is None:
+            _parsed = thaw(opts)
+            parse_options(_parsed)
+        FrozenDict.__init__(self, freeze(_parsed))
+        # The unparsed options are kept for override()
+        self._raw = freeze(opts)
+
+    def override(self, changes):
+        """
+        returns new options with the changes merged in. dictionaries are
+        merged, all other values (including the layers list) are replaced.
+        Only the sections that depend on the changes are parsed again, the
+        others are shared with these options.
+        """
+        raw = _merge(self._raw, changes)
+        parse = set(changes.keys())
+        # The bounds depend on the layers and the projection on the bounds.
+        if 'layers' in parse:
+            parse.add('bounds')
+        if 'bounds' in parse:
+            parse.add('proj')
+        parsed = OrderedDict(self.items())
+        if 'layers' in parse:
+            section = {'layers': thaw(raw.get('layers', []))}
+            parse_layers(section)
+            parsed['layers'] = section['layers']
+        if 'bounds' in parse:
+            section = {'layers': parsed['layers']}
+            if 'bounds' in raw:
+                section['bounds'] = thaw(raw['bounds'])
+            parse_bounds(section)
+            parsed['bounds'] = section['bounds']
+        if 'proj' in parse:
+            section = {}
+            if 'proj' in raw:
+                section['proj'] = thaw(raw['proj'])
+            if 'bounds' in raw:
+                section['bounds'] = raw['bounds']
+            parse_proj(section)
+            parsed['proj'] = section['proj']
+        if 'export' in parse:
+            section = {}
+            if 'export' in raw:
+                section['export'] = thaw(raw['export'])
+            parse_export(section)
+            parsed['export'] = section['export']
+        for key in parse:
+            if key not in ('layers', 'bounds', 'proj', 'export'):
+                parsed[key] = raw[key]
+        return MapOptions(raw, _parsed=parsed)
+
+    def __reduce__(self):
+        return (MapOptions, (self._raw, OrderedDict(self.items())))
@@ -15,6 +15,6 @@ class MapRenderer(object):
         raise 'Not implemented yet'
 
 
-from svg import SvgRenderer
+from svg import SvgRenderer, SvgzRenderer
 
-__all__ = ['MapRenderer', 'SvgRenderer']
+__all__ = ['MapRenderer', 'SvgRenderer', 'SvgzRenderer']
@@ -1,7 +1,7 @@
 
 from kartograph.renderer import MapRenderer
 from kartograph.errors import KartographError
-from kartograph.mapstyle import style_diff, remove_unit
+from kartograph.mapstyle import remove_unit
 
 # This script contains everything that is needed by Kartograph to finally
 # render the processed maps into SVG files.
@@ -10,42 +10,70 @@ from kartograph.mapstyle import style_diff, remove_unit
 # The SVG renderer is based on xml.dom.minidom.
 from xml.dom import minidom
 from xml.dom.minidom import parse
+from collections import OrderedDict
+from itertools import chain
+from operator import sub
+import gzip
+import math
+import os
 import re
+import sys
 
 
 class SvgRenderer(MapRenderer):
 
-    def render(self, style, pretty_print=False):
+    def render(self, style, pretty_print=False, outfile=None):
         """
         The render() method prepares a new empty SVG document and
         stores all the layer features into SVG groups.
+
+        If an outfile is given, the document is not kept in memory but
+        written to the file while the layers are rendered. If rendering
+        fails, the file is closed and the partial map is removed.
         """
         self.style = style
         self.pretty_print = pretty_print
-        self._init_svg_doc()
-        self._store_layers_to_svg()
-        if self.map.options['export']['scalebar'] != False:
-            self._render_scale_bar(self.map.options['export']['scalebar'])
-
-    def _init_svg_doc(self):
+        self.svg = None
+        try:
+            self._init_style_classes()
+            self._init_svg_doc(outfile)
+            self._store_layers_to_svg()
+            if self.map.options['export']['scalebar'] != False:
+                self._render_scale_bar(self.map.options['export']['scalebar'])
+        except Exception:
+            if outfile is not None:
+                _abort(self.svg is not None and self.svg.outfile or outfile)
+            raise
+        if outfile is not None:
+            self.svg.close()
+
+    def _init_svg_doc(self, outfile=None):
         # Load width and height of the map view
         # We add two pixels to the height to ensure that
         # the map fits.
         w = self.map.view.width
         h = self.map.view.height + 2
 
-        # SvgDocument is a handy wrapper around xml.dom.minidom. It is defined below.
-        svg = SvgDocument(
+        # SvgDocument is a handy wrapper around xml.dom.minidom, SvgStream
+        # writes the same markup directly to a file. Both are defined below.
+        if outfile is None:
+            svg = SvgDocument
+        else:
+            svg = lambda **kwargs: SvgStream(outfile, **kwargs)
+        svg = svg(
             width='%dpx' % w,
             height='%dpx' % h,
             viewBox='0 0 %d %d' % (w, h),
             enable_background='new 0 0 %d %d' % (w, h),
             style='stroke-linejoin: round; stroke:#000; fill: none;',
             pretty_print=self.pretty_print)
+        self.svg = svg
 
         defs = svg.node('defs', svg.root)
         style = svg.node('style', defs, type='text/css')
         css = 'path { fill-rule: evenodd; }'
+        if self.style_classes:
+            css += '\n' + self._style_classes_css()
         svg.cdata(css, style)
         metadata = svg.node('metadata', svg.root)
         views = svg.node('views', metadata)
@@ -58,7 +86,6 @@ class SvgRenderer(MapRenderer):
             y=round(self.map.src_bbox.top, 2),
             w=round(self.map.src_bbox.width, 2),
             h=round(self.map.src_bbox.height, 2))
-        self.svg = svg
 
     def _render_feature(self, feature, attributes=[], labelOpts=False):
         node = self._render_geometry(feature.geometry)
@@ -110,70 +137,106 @@ class SvgRenderer(MapRenderer):
 
     def _render_polygon(self, geometry):
         """ constructs a svg representation of a polygon """
-        _round = self.map.options['export']['round']
-        path_str = ""
-        if _round is False:
-            fmt = '%f,%f'
-        else:
-            fmt = '%.' + str(_round) + 'f'
-            fmt = fmt + ',' + fmt
-
+        rings = []
         geoms = hasattr(geometry, 'geoms') and geometry.geoms or [geometry]
         for polygon in geoms:
             if polygon is None:
                 continue
             for ring in [polygon.exterior] + list(polygon.interiors):
-                cont_str = ""
-                kept = []
-                for pt in ring.coords:
-                    kept.append(pt)
-                if len(kept) <= 3:
+                coords = ring.coords
+                if len(coords) <= 3:
                     continue
-                for pt in kept:
-                    if cont_str == "":
-                        cont_str = "M"
-                    else:
-                        cont_str += "L"
-                    cont_str += fmt % pt
-                cont_str += "Z "
-                path_str += cont_str
-        if path_str == "":
-            return None
-        path = self.svg.node('path', d=path_str)
-        return path
+                rings.append(coords)
+        if self.map.options['export']['relative-paths']:
+            return self._relative_path_node([(coords, True) for coords in rings])
+        fmt = self._coord_format()
+        return self._path_node(['M' + _format_coords(coords, fmt) + 'Z ' for coords in rings])
 
     def _render_line(self, geometry):
         """ constructs a svg representation of this line """
+        lines = []
+        geoms = hasattr(geometry, 'geoms') and geometry.geoms or [geometry]
+        for line in geoms:
+            if line is None:
+                continue
+            coords = list(line.coords)
+            if len(coords) == 0:
+                continue
+            lines.append(coords)
+        if self.map.options['export']['relative-paths']:
+            return self._relative_path_node([(coords, coords[0] == coords[-1]) for coords in lines])
+        fmt = self._coord_format()
+        parts = []
+        for coords in lines:
+            parts.append('M' + _format_coords(coords, fmt) + ' ')
+            if coords[0] == coords[-1]:
+                parts.append('Z ')
+        return self._path_node(parts)
+
+    def _coord_format(self):
+        """ returns the format string for a single x,y coordinate """
         _round = self.map.options['export']['round']
-        path_str = ""
         if _round is False:
-            fmt = '%f,%f'
+            fmt = '%f'
         else:
             fmt = '%.' + str(_round) + 'f'
-            fmt = fmt + ',' + fmt
+        return fmt + ',' + fmt
 
-        geoms = hasattr(geometry, 'geoms') and geometry.geoms or [geometry]
-        for line in geoms:
-            if line is None:
-                continue
-            cont_str = ""
-            kept = []
-            for pt in line.coords:
-                kept.append(pt)
-            for pt in kept:
-                if cont_str == "":
-                    cont_str = "M"
-                else:
-                    cont_str += "L"
-                cont_str += fmt % pt
-            cont_str += " "
-            if kept[0] == kept[-1]:
-                cont_str += "Z "
-            path_str += cont_str
+    def _path_node(self, parts):
+        path_str = ''.join(parts)
         if path_str == "":
             return None
-        path = self.svg.node('path', d=path_str)
-        return path
+        if self.map.options['export']['trim-zeros'] and self.map.options['export']['round'] != 0:
+            path_str = _trim_zeros(path_str)
+        return self.svg.node('path', d=path_str)
+
+    def _relative_path_node(self, rings):
+        path_str = _relative_path(rings, self._path_decimals())
+        if path_str == "":
+            return None
+        return self.svg.node('path', d=path_str)
+
+    def _path_decimals(self):
+        """
+        returns the number of decimals of relative paths, which is the
+        export rounding, if set, or chosen from the view size so that
+        the coordinates are precise to a 10000th of the map
+        """
+        _round = self.map.options['export']['round']
+        if _round is not False:
+            return _round
+        size = max(self.map.view.width, self.map.view.height, 1)
+        return max(0, 4 - int(math.ceil(math.log10(size))))
+
+    def _init_style_classes(self):
+        """
+        With export.style-classes, features don't get their own style
+        attributes but a class for each distinct feature style, defined
+        in the stylesheet of the map. The styles are collected before
+        anything is rendered, because the stylesheet comes first in the
+        document. Thanks to the memo in MapStyle that's cheap.
+        """
+        self.style_classes = None
+        if not self.map.options['export']['style-classes']:
+            return
+        classes = OrderedDict()
+        for layer in self.map.layers:
+            if not layer.options['render']:
+                continue
+            for feat in layer.features:
+                feat_css = self.style.getFeatureStyle(layer.id, layer.classes, feat.props)
+                if feat_css:
+                    key = _style_key(feat_css)
+                    if key not in classes:
+                        classes[key] = 'ks%d' % len(classes)
+        self.style_classes = classes
+
+    def _style_classes_css(self):
+        rules = []
+        for key, cls in self.style_classes.iteritems():
+            decl = ' '.join('%s: %s;' % (prop, value) for prop, value in key)
+            rules.append('.%s { %s }' % (cls, decl))
+        return '\n'.join(rules)
 
     def _store_layers_to_svg(self):
         """
@@ -188,7 +251,9 @@ class SvgRenderer(MapRenderer):
             if layer.options['render']:
                 g = svg.node('g', svg.root, id=layer.id)
                 g.setAttribute('class', ' '.join(layer.classes))
-                layer_css = self.style.applyStyle(g, layer.id, layer.classes)
+                self.style.applyStyle(g, layer.id, layer.classes)
+                # The features are written as soon as they are added.
+                svg.open(g)
 
             # Create an svg group for labels of this layer
             lbl = layer.options['labeling']
@@ -198,28 +263,33 @@ class SvgRenderer(MapRenderer):
                     self.style.applyStyle(lgbuf, layer.id + '-label', ['label'])
                     self.style.applyStyle(lgbuf, layer.id + '-label-buffer', ['label-buffer'])
                     _apply_default_label_styles(lgbuf)
-                    lbl['lg-buffer'] = lgbuf
+                else:
+                    lgbuf = None
                 lg = svg.node('g', svg.root, id=layer.id + '-label', stroke='none')
                 self.style.applyStyle(lg, layer.id + '-label', ['label'])
                 _apply_default_label_styles(lg)
-                lbl['lg'] = lg
             else:
                 lg = None
 
             for feat in layer.features:
                 if layer.options['render']:
-                    node = self._render_feature(feat, layer.options['attributes'])
+                    node = self._render_feature(feat, layer.attributes)
                     if node is not None:
-                        feat_css = self.style.getStyle(layer.id, layer.classes, feat.props)
-                        feat_css = style_diff(feat_css, layer_css)
-                        for prop in feat_css:
-                            node.setAttribute(prop, str(feat_css[prop]))
+                        feat_css = self.style.getFeatureStyle(layer.id, layer.classes, feat.props)
+                        if self.style_classes:
+                            if feat_css:
+                                node.setAttribute('class', self.style_classes[_style_key(feat_css)])
+                        else:
+                            for prop in feat_css:
+                                node.setAttribute(prop, str(feat_css[prop]))
                         g.appendChild(node)
                     else:
                         pass
                         #sys.stderr.write("feature.to_svg is None", feat)
                 if lbl is not False:
-                    self._render_label(layer, feat, lbl)
+                    self._render_label(layer, feat, lbl, lg, lgbuf)
+            # Write the layer and its labels.
+            svg.flush()
 
         # Finally add label groups on top of all other groups
         # for lg in label_groups:
@@ -229,7 +299,7 @@ class SvgRenderer(MapRenderer):
         dot = self.svg.node('circle', cx=geometry.x, cy=geometry.y, r=2)
         return dot
 
-    def _render_label(self, layer, feature, labelOpts):
+    def _render_label(self, layer, feature, labelOpts, lg, lgbuf):
         #if feature.geometry.area < 20:
         #    return
         try:
@@ -247,10 +317,10 @@ class SvgRenderer(MapRenderer):
             return
         text = feature.props[key]
         if labelOpts['buffer'] is not False:
-            l = self._label(text, cx, cy, labelOpts['lg-buffer'], labelOpts)
+            l = self._label(text, cx, cy, lgbuf, labelOpts)
             self.style.applyFeatureStyle(l, layer.id + '-label', ['label'], feature.props)
             self.style.applyFeatureStyle(l, layer.id + '-label-buffer', ['label-buffer'], feature.props)
-        l = self._label(text, cx, cy, labelOpts['lg'], labelOpts)
+        l = self._label(text, cx, cy, lg, labelOpts)
         self.style.applyFeatureStyle(l, layer.id + '-label', ['label'], feature.props)
 
     def _label(self, text, x, y, group, opts):
@@ -258,8 +328,6 @@ class SvgRenderer(MapRenderer):
         if 'split-chars' not in opts:
             lines = [text]
         else:
-            if 'split-at' not in opts:
-                opts['split-at'] = 10
             lines = split_at(text, opts['split-chars'], opts['split-at'])
         lh = remove_unit(group.getAttribute('font-size'))
         if lh is None:
@@ -288,10 +356,6 @@ class SvgRenderer(MapRenderer):
 
         svg = self.svg
         meters, pixel = self.map.scale_bar_width()
-        if 'align' not in opts:
-            opts['align'] = 'bl'  # default to bottom left
-        if 'offset' not in opts:
-            opts['offset'] = 20  # 20px offset
         g = svg.node('g', svg.root, id='scalebar', shape__rendering='crispEdges',  text__anchor='middle', stroke='none', fill='#000', font__size=13)
         left = (opts['offset'], self.map.view.width - pixel - opts['offset'])[opts['align'][1] != 'l']
         top = (opts['offset'] + 20, self.map.view.height - opts['offset'])[opts['align'][0] != 't']
@@ -339,6 +403,214 @@ class SvgRenderer(MapRenderer):
         return self.svg.tostring(self.pretty_print)
 
 
+class SvgzRenderer(SvgRenderer):
+    """
+    renders gzip-compressed SVG. The document is compressed while it's
+    written, so the uncompressed markup is never kept in memory.
+    """
+
+    def render(self, style, pretty_print=False, outfile=None):
+        if outfile is not None:
+            outfile = self._gzip(outfile)
+        SvgRenderer.render(self, style, pretty_print, outfile)
+
+    def write(self, outfile):
+        self.svg.write(self._gzip(outfile), self.pretty_print)
+
+    def preview(self, command):
+        # browsers don't open .svgz files from disk, so the preview is
+        # an uncompressed svg
+        self.svg.preview(command, self.pretty_print)
+
+    def _gzip(self, outfile):
+        return _GzipFile(outfile, self.map.options['export']['compression-level'])
+
+
+class _GzipFile(gzip.GzipFile):
+    """
+    gzip file for writing to a file name, a file object or '-' for
+    stdout. Closing it closes the underlying file, too, except stdout.
+    """
+
+    def __init__(self, outfile, level):
+        outfile = _open_output(outfile, 'wb')
+        self.target = outfile
+        # mtime=0 makes the output the same for the same map
+        gzip.GzipFile.__init__(self, filename='', mode='wb', compresslevel=level,
+            fileobj=outfile, mtime=0)
+
+    def close(self):
+        gzip.GzipFile.close(self)
+        if self.target is sys.stdout:
+            self.target.flush()
+        else:
+            self.target.close()
+
+    def abort(self):
+        """ closes the file without finishing the compressed stream """
+        self.fileobj = None
+        _abort(self.target)
+
+
+def _open_output(outfile, mode='w'):
+    """
+    opens the file a map is streamed to. maps are written to a .part
+    file next to the given file name first, which is renamed once the
+    map is complete
+    """
+    if outfile == '-':
+        return sys.stdout
+    if isinstance(outfile, (str, unicode)):
+        return _PartFile(outfile, mode)
+    return outfile
+
+
+def _abort(outfile):
+    """ closes the file of a map that couldn't be rendered """
+    if hasattr(outfile, 'abort'):
+        outfile.abort()
+    elif outfile is not sys.stdout and hasattr(outfile, 'close'):
+        outfile.close()
+
+
+class _PartFile(object):
+
+    def __init__(self, filename, mode):
+        self.name = filename
+        self.part = filename + '.part'
+        self.file = open(self.part, mode)
+
+    def write(self, data):
+        self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+        if os.name == 'nt' and os.path.exists(self.name):
+            # rename doesn't replace files on windows
+            os.remove(self.name)
+        os.rename(self.part, self.name)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.part)
+
+
+def _format_coords(coords, fmt):
+    """
+    formats the coordinates of a ring or line as x,y pairs joined with
+    'L', all at once instead of one point after another
+    """
+    flat = tuple(chain.from_iterable(coords))
+    return 'L'.join([fmt] * (len(flat) / 2)) % flat
+
+
+# Trailing zeros at the end of a number, and the decimal point if nothing
+# is left. All numbers in the path data have decimals, so this never
+# matches zeros before the decimal point.
+_trailing_zeros = re.compile(r'\.?0+(?=[,LZ ])')
+
+
+def _trim_zeros(path_str):
+    """ removes the trailing zeros from all numbers in path data """
+    return _trailing_zeros.sub('', path_str)
+
+
+class _GridNumbers(dict):
+    """
+    formatted numbers for grid coordinates, without trailing zeros and
+    without the zero before the decimal point, e.g. 25 -> '2.5' and
+    -5 -> '-.5' for one decimal. Most of the moves in relative paths
+    are short, so the same few numbers are formatted over and over again.
+    """
+
+    max_size = 100000
+
+    def __init__(self, decimals):
+        self.fmt = '%.' + str(decimals) + 'f'
+        self.scale = float(10 ** decimals)
+
+    def __missing__(self, k):
+        s = self.fmt % (k / self.scale)
+        if '.' in s:
+            s = s.rstrip('0').rstrip('.')
+        if s[:2] == '0.':
+            s = s[1:]
+        elif s[:3] == '-0.':
+            s = '-' + s[2:]
+        if len(self) < self.max_size:
+            self[k] = s
+        return s
+
+
+_grid_numbers = {}
+
+
+def _relative_path(rings, decimals):
+    """
+    returns compact path data for a list of (coords, closed) tuples.
+    The coordinates are snapped to a grid with the given number of
+    decimals and written as relative moves between the grid points, so
+    the rounding errors don't add up. Points that fall on the previous
+    point are left out, and horizontal and vertical moves use h and v.
+    Commands are only repeated where they change. Rings that collapse
+    to a single grid point are left out.
+    """
+    if decimals not in _grid_numbers:
+        _grid_numbers[decimals] = _GridNumbers(decimals)
+    nums = _grid_numbers[decimals]
+    scale = float(10 ** decimals)
+    out = []
+    # the current point, in grid units
+    cx, cy = 0, 0
+    for coords, closed in rings:
+        q = map(int, map(round, map(scale.__mul__, chain.from_iterable(coords))))
+        if closed:
+            # z draws the line back to the start
+            q = q[:-2]
+        if len(q) == 0:
+            continue
+        # the moves between the points, as dx, dy, dx, dy, ...
+        d = map(sub, q[2:], q[:-2])
+        ring = ['m', nums[q[0] - cx], ',', nums[q[1] - cy]]
+        # moves following an m are lines
+        cmd = 'l'
+        for i in xrange(0, len(d), 2):
+            dx = d[i]
+            dy = d[i + 1]
+            if dy:
+                if dx:
+                    ring.append(cmd == 'l' and ',' or 'l')
+                    ring.append(nums[dx])
+                    ring.append(',')
+                    cmd = 'l'
+                else:
+                    ring.append(cmd == 'v' and ',' or 'v')
+                    cmd = 'v'
+                ring.append(nums[dy])
+            elif dx:
+                ring.append(cmd == 'h' and ',' or 'h')
+                ring.append(nums[dx])
+                cmd = 'h'
+        if len(ring) == 4:
+            continue
+        if closed:
+            ring.append('z')
+            cx, cy = q[0], q[1]
+        else:
+            cx, cy = q[-2], q[-1]
+        out.extend(ring)
+    # no separator is needed before a minus sign
+    return ''.join(out).replace(',-', '-')
+
+
+def _style_key(feat_css):
+    """ identifies a feature style by its sorted properties """
+    return tuple(sorted((prop, str(value)) for prop, value in feat_css.iteritems()))
+
+
 def split_at(text, chars, minLen):
     res = [text]
     for char in chars:
@@ -414,7 +686,7 @@ class SvgDocument(object):
         if isinstance(outfile, (str, unicode)):
             outfile = open(outfile, 'w')
         if pretty_print:
-            raw = self.doc.toprettyxml('utf-8')
+            raw = self.doc.toprettyxml(encoding='utf-8')
         else:
             raw = self.doc.toxml('utf-8')
         try:
@@ -440,6 +712,14 @@ class SvgDocument(object):
             return self.doc.toprettyxml()
         return self.doc.toxml()
 
+    # The whole document is written at once, so there's nothing to do
+    # here. See SvgStream below.
+    def open(self, node):
+        pass
+
+    def flush(self):
+        pass
+
     # This is an artifact of an older version of Kartograph, but
     # maybe we'll need it later. It will load an SVG document from
     # a file.
@@ -452,6 +732,187 @@ class SvgDocument(object):
         return svg
 
 
+# SvgStream
+# ---------
+#
+# SvgStream has the same interface as SvgDocument, but writes the nodes
+# to a file as soon as they are complete instead of keeping the whole
+# document in memory. The markup is exactly the same as minidom's.
+#
+# Nodes added to the root element are kept until flush() is called. After
+# open(node), every child added to node is written right away, so the
+# renderer must set up all attributes of the node and its children before
+# adding them.
+#
+
+
+class SvgStream(object):
+
+    def __init__(self, outfile, pretty_print=False, **kwargs):
+        if outfile == '-':
+            # Like printing the document, there's no encoding declaration.
+            outfile = sys.stdout
+            self.encoding = None
+        else:
+            outfile = _open_output(outfile)
+            self.encoding = 'utf-8'
+        self.outfile = outfile
+        if pretty_print:
+            self.addindent, self.newl = '\t', '\n'
+        else:
+            self.addindent, self.newl = '', ''
+        self.root = _StreamElement('svg', self)
+        self.root.setAttribute('xmlns', 'http://www.w3.org/2000/svg')
+        self.root.setAttribute('version', '1.1')
+        self.root.setAttribute('xmlns:xlink', 'http://www.w3.org/1999/xlink')
+        # SvgDocument adds pretty_print as an attribute, too.
+        kwargs['pretty_print'] = pretty_print
+        _add_attrs(self.root, kwargs)
+        self._pending = []
+        self._started = False
+
+    def node(self, name, parent=None, **kwargs):
+        el = _StreamElement(name)
+        _add_attrs(el, kwargs)
+        if parent is not None:
+            parent.appendChild(el)
+        return el
+
+    def cdata(self, data, parent=None):
+        cd = _StreamCData(data)
+        if parent is not None:
+            parent.appendChild(cd)
+        return cd
+
+    def open(self, node):
+        node._stream = self
+
+    def flush(self):
+        """ writes all nodes that have been added to the root element """
+        out = []
+        self._start(out)
+        for node in self._pending:
+            if node._stream is None:
+                _write_node(out, node, self.addindent, self.addindent, self.newl)
+            elif node._started:
+                out.append('%s</%s>%s' % (self.addindent, node.tagName, self.newl))
+            else:
+                # open, but no children have been added
+                _write_start_tag(out, node, self.addindent)
+                out.append('/>' + self.newl)
+        self._pending = []
+        self._write(out)
+
+    def close(self):
+        """ writes the rest of the document and closes the file """
+        self.flush()
+        self._write(['</svg>' + self.newl])
+        if self.outfile is sys.stdout:
+            self.outfile.write('\n')
+            self.outfile.flush()
+        else:
+            self.outfile.close()
+
+    def _append(self, parent, node):
+        if parent is self.root:
+            self._pending.append(node)
+            return
+        # parent is an open node
+        out = []
+        if not parent._started:
+            # Write everything before the parent, and the parent's start tag.
+            self._start(out)
+            pos = self._pending.index(parent)
+            for prev in self._pending[:pos]:
+                _write_node(out, prev, self.addindent, self.addindent, self.newl)
+            self._pending = self._pending[pos:]
+            _write_start_tag(out, parent, self.addindent)
+            out.append('>' + self.newl)
+            parent._started = True
+        _write_node(out, node, self.addindent * 2, self.addindent, self.newl)
+        self._write(out)
+
+    def _start(self, out):
+        if self._started:
+            return
+        newl = self.newl
+        if self.encoding is None:
+            out.append('<?xml version="1.0" ?>' + newl)
+        else:
+            out.append('<?xml version="1.0" encoding="%s"?>%s' % (self.encoding, newl))
+        out.append("<!DOCTYPE svg%s  PUBLIC '-//W3C//DTD SVG 1.1//EN'%s  "
+            "'http://www.w3.org/Graphics/SVG/1.1/DTD/svg11.dtd'>%s" % (newl, newl, newl))
+        _write_start_tag(out, self.root, '')
+        out.append('>' + newl)
+        self._started = True
+
+    def _write(self, out):
+        raw = ''.join(out)
+        if isinstance(raw, unicode):
+            raw = raw.encode('utf-8')
+        self.outfile.write(raw)
+
+
+class _StreamElement(object):
+    """ the part of minidom's Element interface used by the renderer """
+
+    def __init__(self, tagName, stream=None):
+        self.tagName = tagName
+        self.attributes = {}
+        self.childNodes = []
+        # the stream, if the children of this node are written right away
+        self._stream = stream
+        self._started = False
+
+    def setAttribute(self, name, value):
+        self.attributes[name] = value
+
+    def getAttribute(self, name):
+        return self.attributes.get(name, '')
+
+    def appendChild(self, node):
+        if self._stream is not None:
+            self._stream._append(self, node)
+        else:
+            self.childNodes.append(node)
+        return node
+
+
+class _StreamCData(object):
+
+    def __init__(self, data):
+        self.data = data
+
+
+def _escape(data):
+    return data.replace("&", "&amp;").replace("<", "&lt;"). \
+        replace("\"", "&quot;").replace(">", "&gt;")
+
+
+def _write_start_tag(out, node, indent):
+    out.append(indent + '<' + node.tagName)
+    attrs = node.attributes
+    for name in sorted(attrs):
+        out.append(' %s="%s"' % (name, _escape(attrs[name])))
+
+
+def _write_node(out, node, indent, addindent, newl):
+    """ same as minidom's writexml() """
+    if isinstance(node, _StreamCData):
+        if node.data.find(']]>') >= 0:
+            raise ValueError("']]>' not allowed in a CDATA section")
+        out.append('<![CDATA[%s]]>' % node.data)
+        return
+    _write_start_tag(out, node, indent)
+    if node.childNodes:
+        out.append('>' + newl)
+        for child in node.childNodes:
+            _write_node(out, child, indent + addindent, addindent, newl)
+        out.append('%s</%s>%s' % (indent, node.tagName, newl))
+    else:
+        out.append('/>' + newl)
+
+
 def _add_attrs(node, attrs):
     for key in attrs:
         node.setAttribute(key.replace('__', '-'), str(attrs[key]))
@@ -0,0 +1,78 @@
+"""
+runs the per-layer stages of a map in a pool of threads
+
+Every task declares the resources it reads and writes, which usually
+are layer ids. A task waits for all earlier tasks it conflicts with,
+i.e. tasks that write something it reads or writes, or read something
+it writes. That way the result is always the same as if the tasks
+would run one after another, in the order they are given.
+
+Most of the heavy lifting (clipping, unions, differences) happens in
+GEOS, which releases the interpreter lock, so threads are good enough
+here and the features don't need to be copied to other processes.
+"""
+
+from Queue import Queue
+import sys
+
+
+def task_dependencies(tasks):
+    """
+    returns the indexes of the earlier tasks every task needs to wait
+    for. tasks is a list of (func, reads, writes) tuples
+    """
+    resources = [(set(reads), set(writes)) for func, reads, writes in tasks]
+    deps = []
+    for j, (reads, writes) in enumerate(resources):
+        uses = reads | writes
+        deps.append([i for i in range(j)
+            if resources[i][1] & uses or resources[i][0] & writes])
+    return deps
+
+
+def run_tasks(tasks, threads=1):
+    """
+    runs a list of (func, reads, writes) tasks, using up to the given
+    number of threads. exceptions are raised in the calling thread
+    """
+    if threads <= 1 or len(tasks) < 2:
+        for func, reads, writes in tasks:
+            func()
+        return
+
+    from multiprocessing.pool import ThreadPool
+
+    deps = task_dependencies(tasks)
+    waiting = [set(d) for d in deps]
+    dependents = [[] for task in tasks]
+    for j, d in enumerate(deps):
+        for i in d:
+            dependents[i].append(j)
+
+    done = Queue()
+    pool = ThreadPool(min(threads, len(tasks)))
+    try:
+        for j in range(len(tasks)):
+            if len(waiting[j]) == 0:
+                pool.apply_async(_run_task, (j, tasks[j][0], done))
+        for k in range(len(tasks)):
+            i, error = done.get()
+            if error is not None:
+                raise error[0], error[1], error[2]
+            # Start the tasks that only have been waiting for this one.
+            for j in dependents[i]:
+                waiting[j].discard(i)
+                if len(waiting[j]) == 0:
+                    pool.apply_async(_run_task, (j, tasks[j][0], done))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _run_task(i, func, done):
+    """ runs a task in a worker thread and reports back to the scheduler """
+    try:
+        func()
+        done.put((i, None))
+    except Exception:
+        done.put((i, sys.exc_info()))
@@ -1,10 +1,10 @@
-
-__all__ = ['create_point_store', 'unify_polygon', 'unify_polygons', 'simplify_lines']
+__all__ = ['create_point_store', 'unify_rings', 'simplify_lines', 'rank_lines', 'filter_lines', 'simplify_jobs', 'collapse_lines', 'PointStore', 'Topology', 'topology_key']
 
 from unify import *
+from topology import Topology, topology_key, _unique_points
 from distance import simplify_distance
-from douglas_peucker import simplify_douglas_peucker
-from visvalingam import simplify_visvalingam_whyatt
+from douglas_peucker import simplify_douglas_peucker, rank_douglas_peucker, filter_douglas_peucker
+from visvalingam import simplify_visvalingam_whyatt, rank_visvalingam_whyatt, filter_visvalingam_whyatt
 
 
 simplification_methods = dict()
@@ -12,17 +12,92 @@ simplification_methods['distance'] = simplify_distance
 simplification_methods['douglas-peucker'] = simplify_douglas_peucker
 simplification_methods['visvalingam-whyatt'] = simplify_visvalingam_whyatt
 
+# Methods that support ranked simplification. The ranking function computes
+# a rank for every point once, the filter function then removes all points
+# that rank below a given tolerance.
+ranking_methods = dict()
+ranking_methods['douglas-peucker'] = (rank_douglas_peucker, filter_douglas_peucker)
+ranking_methods['visvalingam-whyatt'] = (rank_visvalingam_whyatt, filter_visvalingam_whyatt)
+
 
-def simplify_lines(lines, method, params):
-    """ simplifies a set of lines """
+def simplify_lines(lines, point_store, method, params):
+    """ simplifies a set of lines given as lists of point ids """
     simplify = simplification_methods[method]
     out = []
     for line in lines:
-        # remove duplicate points from line
-        unique = [line[0]]
-        for i in range(1, len(line)):
-            if line[i] != line[i - 1]:
-                unique.append(line[i])
-        simplify(unique, params)
+        unique = _unique_points(line)
+        simplify(unique, point_store, params)
         out.append(unique)
     return out
+
+
+def rank_lines(lines, point_store, method):
+    """
+    computes the ranks of the points of a set of lines, returns the lines
+    which then can be passed to filter_lines() as often as needed
+    """
+    rank = ranking_methods[method][0]
+    point_store.init_ranks()
+    out = []
+    for line in lines:
+        unique = _unique_points(line)
+        rank(unique, point_store)
+        out.append(unique)
+    return out
+
+
+def filter_lines(lines, point_store, method, tolerance):
+    """ simplifies a set of ranked lines """
+    simplify = ranking_methods[method][1]
+    for line in lines:
+        simplify(line, point_store, tolerance)
+    return lines
+
+
+
+def collapse_lines(lines, point_store, min_extent):
+    """
+    removes all points but the first and last of lines whose bounding box
+    is smaller than min_extent in both directions, and flags them as
+    simplified so they are skipped by the simplification methods. returns
+    the number of collapsed lines
+    """
+    xs = point_store.x
+    ys = point_store.y
+    simplified = point_store.simplified
+    deleted = point_store.deleted
+    collapsed = 0
+    for line in lines:
+        if len(line) < 3 or simplified[line[1]]:
+            continue
+        x = [xs[pt] for pt in line]
+        if max(x) - min(x) >= min_extent:
+            continue
+        y = [ys[pt] for pt in line]
+        if max(y) - min(y) >= min_extent:
+            continue
+        for i in range(1, len(line) - 1):
+            deleted[line[i]] = 1
+        for pt in line:
+            simplified[pt] = 1
+        collapsed += 1
+    return collapsed
+
+
+def simplify_jobs(jobs, point_store, processes=1):
+    """
+    simplifies the lines of several features, given as a list of
+    (lines, method, tolerance, ranked) tuples. the simplified lines are
+    yielded job by job, so the geometries can be restored in between
+    """
+    if processes > 1:
+        from parallel import simplify_parallel
+        for lines in simplify_parallel(jobs, point_store, processes):
+            yield lines
+        return
+    for lines, method, tolerance, ranked in jobs:
+        if ranked:
+            # Ranked lines only need to be filtered.
+            yield filter_lines(lines, point_store, method, tolerance)
+        else:
+            yield simplify_lines(lines, point_store, method, tolerance)
@@ -1,6 +1,5 @@
 
-
-def simplify_distance(points, dist):
+def simplify_distance(points, point_store, dist):
     """
     simplifies a line segment using a very simple algorithm that checks the distance
     to the last non-deleted point. the algorithm operates on line segments.
@@ -11,9 +10,12 @@ def simplify_distance(points, dist):
     """
     dist_sq = dist * dist
     n = len(points)
+    xs = point_store.x
+    ys = point_store.y
+    simplified = point_store.simplified
+    deleted = point_store.deleted
 
     kept = []
-    deleted = 0
     if n < 4:
         return points
 
@@ -21,23 +23,23 @@ def simplify_distance(points, dist):
         pt = points[i]
         if i == 0 or i == n - 1:
             # never remove first or last point of line
-            pt.simplified = True
+            simplified[pt] = 1
             lpt = pt
             kept.append(pt)
         else:
-            d = (pt.x - lpt.x) * (pt.x - lpt.x) + (pt.y - lpt.y) * (pt.y - lpt.y)  # compute distance to last point
-            if pt.simplified or d > dist_sq:  # if point already handled or distance exceeds threshold..
+            dx = xs[pt] - xs[lpt]
+            dy = ys[pt] - ys[lpt]
+            d = dx * dx + dy * dy  # compute distance to last point
+            if simplified[pt] or d > dist_sq:  # if point already handled or distance exceeds threshold..
                 kept.append(pt)  # ..keep the point
                 lpt = pt
             else:  # otherwise remove it
-                deleted += 1
-                pt.deleted = True
-            pt.simplified = True
+                deleted[pt] = 1
+            simplified[pt] = 1
 
     if len(kept) < 4:
         for pt in points:
-            pt.deleted = False
+            deleted[pt] = 0
         return points
 
     return kept
-    #print 'kept %d   deleted %d' % (kept, deleted)
@@ -1,6 +1,7 @@
+from math import sqrt
 
 
-def simplify_douglas_peucker(points, epsilon):
+def simplify_douglas_peucker(points, point_store, epsilon):
     """
     simplifies a line segment using the Douglas-Peucker algorithm.
 
@@ -12,61 +13,126 @@ def simplify_douglas_peucker(points, epsilon):
     - flags all points as simplified after processing (so it won't be processed twice)
     """
     n = len(points)
-    kept = []
     if n < 4:
         return points  # skip short lines
+    if point_store.simplified[points[1]]:
+        return points
 
-    if not points[0].simplified:
-        _douglas_peucker(points, 0, n - 1, epsilon)
-
-    return kept
-    #print 'kept %d   deleted %d' % (kept, deleted)
-
-
-def _douglas_peucker(points, start, end, epsilon):
-    """ inner part of Douglas-Peucker algorithm, called recursively """
-    dmax = 0
-    index = 0
-
-    # Find the point with the maximum distance
-    for i in range(start + 1, end):
-        x1, y1 = points[start]
-        x2, y2 = points[end]
-        if x1 == x2 and y1 == y2:
-            return
-        x3, y3 = points[i]
-        d = _min_distance(x1, y1, x2, y2, x3, y3)
-        if d > dmax:
-            index = i
-            dmax = d
-
-    # If max distance is greater than epsilon, recursively simplify
-    if dmax >= epsilon and start < index < end:
-        # recursivly call
-        _douglas_peucker(points, start, index, epsilon)
-        _douglas_peucker(points, index, end, epsilon)
-    else:
-        # remove any point but the first and last
-        for i in range(start, end + 1):
-            points[i].deleted = i == start or i == end
-            points[i].simplified = True
-
-
-def _min_distance(x1, y1, x2, y2, x3, y3):
+    keep = _douglas_peucker(points, point_store, epsilon)
+    deleted = point_store.deleted
+    for i in range(1, n - 1):
+        if not keep[i]:
+            deleted[points[i]] = 1
+
+    for pt in points:
+        point_store.simplified[pt] = 1
+    return points
+
+
+def rank_douglas_peucker(points, point_store):
     """
-    the perpendicular distance from a point (x3,y3) to the line from (x1,y1) to (x2,y2)
-    taken from http://local.wasp.uwa.edu.au/~pbourke/geometry/pointline/
+    stores the largest tolerance at which each point would still be kept
+    as its rank, so the line can later be simplified to any tolerance
+    using filter_douglas_peucker()
     """
-    d = _dist(x1, y1, x2, y2)
-    u = (x3 - x1) * (x2 - x1) + (y3 - y1) * (y2 - y1) / (d * d)
-    x = x1 + u * (x2 - x1)
-    y = y1 + u * (y2 - y1)
-    return _dist(x, y, x3, y3)
+    n = len(points)
+    if n < 4:
+        return
+    if point_store.simplified[points[1]]:
+        return
+
+    xs = point_store.x
+    ys = point_store.y
+    x = [xs[pt] for pt in points]
+    y = [ys[pt] for pt in points]
+    rank = point_store.rank
+
+    # a point is only kept if the points that split the line before
+    # are kept, too
+    stack = [(0, n - 1, float('inf'))]
+    while stack:
+        start, end, parent = stack.pop()
+        if end - start < 2:
+            continue
+        dmax, index = _max_distance(x, y, start, end)
+        dmax = min(dmax, parent)
+        rank[points[index]] = dmax
+        stack.append((start, index, dmax))
+        stack.append((index, end, dmax))
 
+    for pt in points:
+        point_store.simplified[pt] = 1
+
+
+def filter_douglas_peucker(points, point_store, epsilon):
+    """
+    simplifies a line that has been ranked before, which gives the
+    same result as simplify_douglas_peucker()
+    """
+    n = len(points)
+    if n < 4:
+        return points
+    if point_store.simplified[points[1]]:
+        return points
 
-def _dist(x1, y1, x2, y2):
-    """ eucledian distance between two points """
-    import math
+    rank = point_store.rank
+    deleted = point_store.deleted
+    for i in range(1, n - 1):
+        if rank[points[i]] < epsilon:
+            deleted[points[i]] = 1
+
+    for pt in points:
+        point_store.simplified[pt] = 1
+    return points
+
+
+def _douglas_peucker(points, point_store, epsilon):
+    """
+    inner part of Douglas-Peucker algorithm, returns a bytearray that
+    flags the points to keep.
+
+    the segments that still need to be looked at are kept on an explicit
+    stack instead of recursing, so long rivers won't hit the recursion limit.
+    """
+    n = len(points)
+    xs = point_store.x
+    ys = point_store.y
+    x = [xs[pt] for pt in points]
+    y = [ys[pt] for pt in points]
+    keep = bytearray(n)
+    keep[0] = keep[n - 1] = 1
+
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        # Find the point with the maximum distance
+        dmax, index = _max_distance(x, y, start, end)
+        if dmax >= epsilon:
+            keep[index] = 1
+            stack.append((start, index))
+            stack.append((index, end))
+    return keep
+
+
+def _max_distance(x, y, start, end):
+    """
+    returns the maximum perpendicular distance of the points between
+    start and end to the line from start to end, and the index of the
+    point that is farthest away
+    """
+    x1, y1 = x[start], y[start]
+    x2, y2 = x[end], y[end]
     dx = x2 - x1
     dy = y2 - y1
-    return math.sqrt(dx * dx + dy * dy)
+    pts = zip(x[start + 1:end], y[start + 1:end])
+    if dx == 0 and dy == 0:
+        # closed ring, so we take the distance to the first point
+        dists = [(px - x1) * (px - x1) + (py - y1) * (py - y1) for px, py in pts]
+        d = max(dists)
+        return sqrt(d), start + 1 + dists.index(d)
+    # the cross product is the distance to the line, scaled by its length
+    dists = [abs(dx * (py - y1) - dy * (px - x1)) for px, py in pts]
+    d = max(dists)
+    return d / sqrt(dx * dx + dy * dy), start + 1 + dists.index(d)
@@ -0,0 +1,150 @@
+"""
+parallel line simplification
+
+Once the topology is computed, the lines can be simplified independently
+of each other. The only thing they share is the simplified flag, which
+makes sure that a line that is shared by two features is only simplified
+once. So we first decide which lines need to be simplified, exactly the
+way the serial loop would, and then send the coordinates of these lines
+in chunks to a pool of worker processes. The workers send back which
+points have been deleted.
+"""
+
+from unify import PointStore
+from topology import _unique_points
+from array import array
+
+# Lines shorter than this are left alone by the simplification methods,
+# without being flagged as simplified.
+_min_points = {
+    'douglas-peucker': 4,
+    'visvalingam-whyatt': 3
+}
+
+
+def simplify_parallel(jobs, point_store, processes):
+    """
+    simplifies the lines of several features using a pool of processes.
+    jobs is a list of (lines, method, tolerance, ranked) tuples. the
+    simplified lines are yielded job by job, in the same order and with
+    the same result as simplify_jobs().
+    """
+    from kartograph.simplify import simplification_methods, ranking_methods
+
+    jobs = [([_unique_points(line) for line in lines], method, tolerance, ranked)
+        for lines, method, tolerance, ranked in jobs]
+    masks = iter(_compute_masks(jobs, point_store, processes))
+
+    # Now we go through the lines again, this time for real. Points are
+    # deleted job by job, since lines (unlike arcs) may share points
+    # with lines of other features.
+    simplified = point_store.simplified
+    deleted = point_store.deleted
+    for lines, method, tolerance, ranked in jobs:
+        for line in lines:
+            if ranked:
+                ranking_methods[method][1](line, point_store, tolerance)
+            elif method not in _min_points:
+                simplification_methods[method](line, point_store, tolerance)
+            elif len(line) >= _min_points[method] and not simplified[line[1]]:
+                mask = masks.next()
+                for i in range(len(line)):
+                    if mask[i]:
+                        deleted[line[i]] = 1
+                    simplified[line[i]] = 1
+        yield lines
+
+
+def _compute_masks(jobs, point_store, processes):
+    """
+    finds the lines that need to be simplified and simplifies them in
+    a pool of processes. returns the deleted flags for each of them
+    """
+    from multiprocessing import Pool
+
+    # Decide which lines are going to be simplified, the way the serial
+    # loop would, so we flag points on a copy of the simplified flags.
+    simplified = bytearray(point_store.simplified)
+    tasks = []
+    for lines, method, tolerance, ranked in jobs:
+        for line in lines:
+            min_points = _min_points.get(method, 4)
+            if len(line) < min_points:
+                continue
+            if ranked or method in _min_points:
+                if simplified[line[1]]:
+                    continue
+                if not ranked:
+                    tasks.append((line, method, tolerance))
+            for pt in line:
+                simplified[pt] = 1
+
+    if len(tasks) == 0:
+        return []
+
+    xs = point_store.x
+    ys = point_store.y
+    chunks = _chunks(tasks, processes * 4)
+    payload = []
+    for chunk in chunks:
+        methods = []
+        offsets = array('l', [0])
+        x = array('d')
+        y = array('d')
+        for line, method, tolerance in chunk:
+            methods.append((method, tolerance))
+            for pt in line:
+                x.append(xs[pt])
+                y.append(ys[pt])
+            offsets.append(len(x))
+        payload.append((methods, offsets, x, y))
+
+    pool = Pool(processes)
+    try:
+        results = pool.map(_simplify_chunk, payload)
+    finally:
+        pool.close()
+        pool.join()
+
+    masks = []
+    for (methods, offsets, x, y), mask in zip(payload, results):
+        for i in range(len(methods)):
+            masks.append(mask[offsets[i]:offsets[i + 1]])
+    return masks
+
+
+def _chunks(tasks, num):
+    """ splits the tasks into about num chunks with similar numbers of points """
+    total = sum(len(line) for line, method, tolerance in tasks)
+    size = max(1, total / num)
+    chunks = []
+    chunk = []
+    n = 0
+    for task in tasks:
+        chunk.append(task)
+        n += len(task[0])
+        if n >= size:
+            chunks.append(chunk)
+            chunk = []
+            n = 0
+    if len(chunk) > 0:
+        chunks.append(chunk)
+    return chunks
+
+
+def _simplify_chunk(payload):
+    """
+    simplifies a chunk of lines given as flat coordinate arrays, returns
+    a bytearray flagging the deleted points
+    """
+    from kartograph.simplify import simplification_methods
+    methods, offsets, x, y = payload
+    store = PointStore()
+    store.x = x
+    store.y = y
+    store.simplified = bytearray(len(x))
+    store.deleted = bytearray(len(x))
+    for i, (method, tolerance) in enumerate(methods):
+        line = array('l', range(offsets[i], offsets[i + 1]))
+        simplification_methods[method](line, store, tolerance)
+    return store.deleted
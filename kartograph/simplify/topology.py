@@ -0,0 +1,117 @@
+"""
+shared-arc topology
+
+The features of all simplified layers are broken into arcs, which are
+line segments between junctions, i.e. points where the set of features
+a point belongs to changes. Arcs shared by neighbouring features are
+stored only once, and each feature references its arcs by index (with
+~index for arcs that run in the opposite direction).
+
+Since the topology only depends on the geometries, it can be cached and
+reused by maps that render the same features again.
+"""
+
+from unify import create_point_store
+from array import array
+from hashlib import sha1
+
+
+class Topology(object):
+
+    # attributes features need for restoring their geometry
+    _feature_attrs = ('_topology_num_holes', '_topology_lines_per_ring')
+
+    def __init__(self):
+        self.point_store = create_point_store()
+        self.arcs = []
+        # maps the point ids of an arc to its index
+        self._arc_index = {}
+        # arc references and topology attributes for every feature
+        self.features = []
+        self._pending = []
+
+    def add_feature(self, feature, precision=None):
+        """
+        unifies the points of a feature. features must be added in the
+        same order they are passed to attach() later on
+        """
+        feature.compute_topology(self.point_store, precision)
+        self._pending.append(feature)
+
+    def build(self):
+        """
+        breaks all features into arcs, after all features have been added
+        """
+        self.point_store.drop_index()
+        for feature in self._pending:
+            refs = array('l')
+            for line in feature.break_into_lines():
+                refs.append(self._arc_ref(_unique_points(line)))
+            attrs = {}
+            for attr in self._feature_attrs:
+                if hasattr(feature, attr):
+                    attrs[attr] = getattr(feature, attr)
+            # the rings aren't needed anymore
+            feature._topology_rings = None
+            self.features.append((refs, attrs))
+        self._pending = []
+
+    def attach(self, features):
+        """
+        sets up a list of features for simplification and restoring
+        their geometries. the features must have the same geometries as
+        the ones the topology has been built from
+        """
+        if len(features) != len(self.features):
+            raise ValueError('number of features does not match the topology')
+        for feature, (refs, attrs) in zip(features, self.features):
+            feature._topology_store = self.point_store
+            feature._topology_lines = [self.arc(ref) for ref in refs]
+            for attr, value in attrs.iteritems():
+                setattr(feature, attr, value)
+
+    def arc(self, ref):
+        """ returns the point ids of an arc reference """
+        if ref >= 0:
+            return self.arcs[ref]
+        line = array('l', self.arcs[~ref])
+        line.reverse()
+        return line
+
+    def _arc_ref(self, line):
+        """ returns the reference to an arc, adds the arc if it's new """
+        key = line.tostring()
+        ref = self._arc_index.get(key)
+        if ref is not None:
+            return ref
+        rev = array('l', line)
+        rev.reverse()
+        ref = self._arc_index.get(rev.tostring())
+        if ref is not None:
+            return ~ref
+        ref = self._arc_index[key] = len(self.arcs)
+        self.arcs.append(line)
+        return ref
+
+
+def topology_key(features):
+    """
+    computes a cache key for the topology of a list of features, given
+    as (feature, settings) tuples. settings are all options the topology
+    depends on, such as the unify precision
+    """
+    h = sha1()
+    for feature, settings in features:
+        h.update(repr(settings))
+        if feature.geom is not None:
+            h.update(feature.geom.wkb)
+    return h.hexdigest()
+
+
+def _unique_points(line):
+    """ removes duplicate points from line """
+    unique = array('l', line[:1])
+    for i in range(1, len(line)):
+        if line[i] != line[i - 1]:
+            unique.append(line[i])
+    return unique
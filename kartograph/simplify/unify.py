@@ -1,15 +1,110 @@
-
-from mpoint import MPoint
+from array import array
 
 """
-the whole point of the unification step is to convert all points into unique MPoint instances
+the whole point of the unification step is to convert all points into unique
+integer point ids. all per-point data is kept in flat arrays of the point store
 """
 
 
+class PointStore(object):
+    """
+    Stores the unified points of all simplified layers.
+
+    Points are identified by their index in the coordinate arrays. Instead of
+    keeping a set of features for every point, we intern each distinct set of
+    features once and only store the index of that set per point.
+    """
+
+    def __init__(self):
+        self.x = array('d')
+        self.y = array('d')
+        self.simplified = bytearray()
+        self.deleted = bytearray()
+        self.keep = bytearray()
+        # index into feature_sets for every point
+        self.features = array('l')
+        self.feature_sets = [frozenset()]
+        self._feature_set_ids = {frozenset(): 0}
+        self._feature_set_add = {}
+        self._feature_ids = {}
+        # maps quantized coordinate pairs to point ids
+        self._index = {}
+        # effective areas or distance thresholds, see rank_lines()
+        self.rank = None
+        self.kept = 0
+        self.removed = 0
+
+    def __len__(self):
+        return len(self.x)
+
+    def feature_id(self, feature):
+        """ returns the integer id of a feature """
+        fid = self._feature_ids.get(feature)
+        if fid is None:
+            fid = self._feature_ids[feature] = len(self._feature_ids)
+        return fid
+
+    def add_point(self, x, y, key):
+        """ returns the id of the point stored under key, creates it if needed """
+        pid = self._index.get(key)
+        if pid is not None:
+            self.removed += 1
+            return pid
+        pid = self._index[key] = len(self.x)
+        self.x.append(x)
+        self.y.append(y)
+        self.simplified.append(0)
+        self.deleted.append(0)
+        self.keep.append(0)
+        self.features.append(0)
+        self.kept += 1
+        return pid
+
+    def add_feature(self, pid, fid):
+        """ adds a feature id to the set of features a point belongs to """
+        fsid = self.features[pid]
+        new_fsid = self._feature_set_add.get((fsid, fid))
+        if new_fsid is None:
+            fset = self.feature_sets[fsid] | frozenset([fid])
+            new_fsid = self._feature_set_ids.get(fset)
+            if new_fsid is None:
+                new_fsid = self._feature_set_ids[fset] = len(self.feature_sets)
+                self.feature_sets.append(fset)
+            self._feature_set_add[(fsid, fid)] = new_fsid
+        self.features[pid] = new_fsid
+
+    def is_shared(self, pid):
+        """ returns True if a point belongs to more than one feature """
+        return len(self.feature_sets[self.features[pid]]) > 1
+
+    def drop_index(self):
+        """
+        frees the coordinate hash once the topology has been computed
+        """
+        self._index = {}
+        self._feature_set_add = {}
+        self._feature_ids = {}
+
+    def init_ranks(self):
+        """
+        allocates the rank array, points that never get a rank (such
+        as the end points of lines) are never removed
+        """
+        if self.rank is None:
+            self.rank = array('d', [float('inf')]) * len(self.x)
+
+    def reset_simplification(self):
+        """
+        restores all deleted points so the lines can be simplified again
+        """
+        n = len(self.x)
+        self.simplified = bytearray(n)
+        self.deleted = bytearray(n)
+
+
 def create_point_store():
     """ creates a new point_store """
-    point_store = {'kept': 0, 'removed': 0}
-    return point_store
+    return PointStore()
 
 
 def unify_rings(rings, point_store, precision=None, feature=None):
@@ -21,31 +116,43 @@ def unify_rings(rings, point_store, precision=None, feature=None):
 
 def unify_ring(ring, point_store, precision=None, feature=None):
     """
-    Replaces duplicate points with MPoint instances
+    Replaces the points of a ring with unique point ids
     """
-    out_ring = []
-    lptid = ''
+    out_ring = array('l')
+    scale = 10 ** _precision_digits(precision)
+    fid = point_store.feature_id(feature)
+    lkey = None
     for pt in ring:
-        if 'deleted' not in pt:
-            pt = MPoint(pt[0], pt[1])  # eventually convert to MPoint
-        # generate hash for point
-        if precision is not None:
-            fmt = '%' + precision + 'f-%' + precision + 'f'
-        else:
-            fmt = '%f-%f'
-        pid = fmt % (pt.x, pt.y)
-        if pid == lptid:
+        x = pt[0]
+        y = pt[1]
+        # Quantize the coordinates to get a key for the point. We pack
+        # the integer pair into a complex number since that's a lot
+        # smaller than a tuple of two ints.
+        key = complex(round(x * scale), round(y * scale))
+        if key == lkey:
             continue  # skip double points
-        lptid = pid
-        if pid in point_store:
-            # load existing point from point store
-            point = point_store[pid]
-            point_store['removed'] += 1
-        else:
-            point = pt
-            point_store['kept'] += 1
-            point_store[pid] = pt
-
-        point.features.add(feature)
-        out_ring.append(point)
+        lkey = key
+        pid = point_store.add_point(x, y, key)
+        point_store.add_feature(pid, fid)
+        out_ring.append(pid)
     return out_ring
+
+
+def _precision_digits(precision):
+    """
+    converts the unify-precision setting (e.g. '.2' or 2) into the number
+    of decimal digits that are used for comparing points
+    """
+    if precision is None:
+        return 6
+    if isinstance(precision, (int, long)):
+        return precision
+    # strings are format specs like '.2', a width alone doesn't change
+    # the number of digits
+    precision = str(precision)
+    if '.' not in precision:
+        return 6
+    try:
+        return int(precision.split('.')[1])
+    except ValueError:
+        return 6
@@ -1,71 +1,142 @@
+from heapq import heapify, heappush, heappop
 
 
-def simplify_visvalingam_whyatt(points, tolerance):
+def simplify_visvalingam_whyatt(points, point_store, tolerance):
     """ Visvalingam-Whyatt simplification
-    implementation borrowed from @migurski:
-    https://github.com/migurski/Bloch/blob/master/Bloch/__init__.py#L133
+
+    Uses a min-heap of triangle areas, so every point is removed in
+    O(log n) instead of recomputing and sorting all areas over and over.
+    The effective area of a point never drops below the area of a point
+    that has been removed before, which keeps the elimination order
+    monotone.
     """
     if len(points) < 3:
         return
-    if points[1].simplified:
+    if point_store.simplified[points[1]]:
         return
 
     min_area = tolerance ** 2
+    areas = effective_areas(points, point_store, stop_area=min_area, min_points=4)
 
-    pts = range(len(points))  # pts stores an index of all non-deleted points
+    deleted = point_store.deleted
+    for i in range(1, len(points) - 1):
+        if areas[i] <= min_area:
+            deleted[points[i]] = 1
 
-    while len(pts) > 4:
-        preserved, popped = set(), []
-        areas = []
+    for pt in points:
+        point_store.simplified[pt] = 1
 
-        for i in range(1, len(pts) - 1):
-            x1, y1 = points[pts[i - 1]]
-            x2, y2 = points[pts[i]]
-            x3, y3 = points[pts[i + 1]]
-            # compute and store triangle area
-            areas.append((_tri_area(x1, y1, x2, y2, x3, y3), i))
 
-        areas = sorted(areas)
+def rank_visvalingam_whyatt(points, point_store):
+    """
+    stores the effective area of every point as its rank, so the line
+    can later be simplified to any tolerance using
+    filter_visvalingam_whyatt()
+    """
+    if len(points) < 3:
+        return
+    if point_store.simplified[points[1]]:
+        return
 
-        if not areas or areas[0][0] > min_area:
-            # there's nothing to be done
-            for pt in points:
-                pt.simplified = True
-            break
+    areas = effective_areas(points, point_store, min_points=4)
+    rank = point_store.rank
+    for i in range(1, len(points) - 1):
+        rank[points[i]] = areas[i]
 
-        # Reduce any segments that makes a triangle whose area is below
-        # the minimum threshold, starting with the smallest and working up.
-        # Mark segments to be preserved until the next iteration.
+    for pt in points:
+        point_store.simplified[pt] = 1
 
-        for (area, i) in areas:
 
-            if area > min_area:
-                # there won't be any more points to remove.
-                break
+def filter_visvalingam_whyatt(points, point_store, tolerance):
+    """
+    simplifies a line that has been ranked before, which gives the
+    same result as simplify_visvalingam_whyatt()
+    """
+    if len(points) < 3:
+        return
+    if point_store.simplified[points[1]]:
+        return
 
-            if i - 1 in preserved or i + 1 in preserved:
-                # the current segment is too close to a previously-preserved one.
-                #print "-pre", preserved
-                continue
+    min_area = tolerance ** 2
+    rank = point_store.rank
+    deleted = point_store.deleted
+    for i in range(1, len(points) - 1):
+        if rank[points[i]] <= min_area:
+            deleted[points[i]] = 1
 
-            points[pts[i]].deleted = True
-            popped.append(i)
+    for pt in points:
+        point_store.simplified[pt] = 1
 
-            # make sure that the adjacent points
-            preserved.add(i - 1)
-            preserved.add(i + 1)
 
-        if len(popped) == 0:
-            # no points removed, so break out of loop
+def effective_areas(points, point_store, stop_area=None, min_points=2):
+    """
+    computes the effective area of each point of a line, which is the area
+    of the triangle it formed with its neighbours at the time it has been
+    eliminated. the first and last point are never eliminated and get an
+    infinite area.
+
+    if stop_area is given, the elimination stops as soon as the smallest
+    area exceeds it. points that haven't been eliminated until then, or
+    because there were only min_points left, get an infinite area, too.
+    """
+    n = len(points)
+    xs = point_store.x
+    ys = point_store.y
+    inf = float('inf')
+    areas = [inf] * n
+    if n < 3:
+        return areas
+
+    x = [xs[pt] for pt in points]
+    y = [ys[pt] for pt in points]
+    prev = range(-1, n - 1)
+    nxt = range(1, n + 1)
+
+    heap = []
+    for i in range(1, n - 1):
+        a = _tri_area(x[i - 1], y[i - 1], x[i], y[i], x[i + 1], y[i + 1])
+        areas[i] = a
+        heap.append((a, i))
+    heapify(heap)
+
+    remaining = n
+    max_area = 0
+    while heap and remaining > min_points:
+        a, i = heappop(heap)
+        if a != areas[i] or nxt[i] is None:
+            # outdated heap entry
+            continue
+        if stop_area is not None and a > stop_area:
             break
-
-        popped = sorted(popped, reverse=True)
-        for i in popped:
-            # remove point from index list
-            pts = pts[:i] + pts[i + 1:]
-
-    for pt in points:
-        pt.simplified = True
+        # The effective area must not be smaller than the area of any
+        # previously eliminated point.
+        if a < max_area:
+            a = areas[i] = max_area
+        else:
+            max_area = a
+        # remove point i from the linked list
+        p = prev[i]
+        q = nxt[i]
+        nxt[p] = q
+        prev[q] = p
+        nxt[i] = None
+        remaining -= 1
+        # ..and update the areas of its neighbours
+        for j in (p, q):
+            if 0 < j < n - 1:
+                pj = prev[j]
+                nj = nxt[j]
+                aj = _tri_area(x[pj], y[pj], x[j], y[j], x[nj], y[nj])
+                if aj < max_area:
+                    aj = max_area
+                areas[j] = aj
+                heappush(heap, (aj, j))
+
+    # Points that are still left have not been eliminated.
+    for i in range(1, n - 1):
+        if nxt[i] is not None:
+            areas[i] = inf
+    return areas
 
 
 def _tri_area(x1, y1, x2, y2, x3, y3):
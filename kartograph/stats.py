@@ -0,0 +1,129 @@
+"""
+timing and size statistics for the stages of a map
+
+Map and Kartograph record how long every stage took, in wall clock and
+CPU time, and how many features (and optionally vertices) each layer
+had after it. The records can be dumped as JSON or as a trace file for
+chrome://tracing.
+
+Note that the CPU time is measured for the whole process, so with
+export.threads > 1 it includes the work of stages running at the same
+time.
+"""
+
+from geometry.utils import count_vertices
+import threading
+import time
+
+
+class Stats(object):
+
+    def __init__(self, vertices=False):
+        # Counting the vertices walks through all geometries after every
+        # stage, so it's only done if needed.
+        self.vertices = vertices
+        self.records = []
+        self._start = time.time()
+        self._lock = threading.Lock()
+
+    def measure(self, stage, layer=None):
+        """
+        returns a context manager that records the time spent in a stage:
+
+            with stats.measure('join', layer):
+                ...
+
+        for layer stages the features (and vertices) of the layer are
+        counted afterwards, unless other features are passed to count()
+        """
+        return _Measure(self, stage, layer)
+
+    def count(self, stage, layer, features=None):
+        """ records the size of a layer after a stage that isn't timed per layer """
+        if features is None:
+            features = layer.features
+        record = dict(stage=stage, layer=layer.id, wall=None, cpu=None)
+        self._count(record, features)
+        self._add(record)
+
+    def totals(self):
+        """ returns the wall and cpu time spent in each stage """
+        totals = {}
+        for record in self.records:
+            if record['wall'] is None:
+                continue
+            total = totals.setdefault(record['stage'], dict(wall=0, cpu=0))
+            total['wall'] += record['wall']
+            total['cpu'] += record['cpu']
+        return totals
+
+    def as_dict(self):
+        return dict(stages=self.totals(), records=self.records)
+
+    def write_json(self, outfile):
+        import json
+        json.dump(self.as_dict(), outfile, indent=2, sort_keys=True)
+
+    def write_trace(self, outfile):
+        """ writes the timed records in the Chrome trace event format """
+        import json
+        threads = {}
+        events = []
+        for record in self.records:
+            if record['wall'] is None:
+                continue
+            tid = threads.setdefault(record['thread'], len(threads) + 1)
+            args = dict((key, value) for key, value in record.iteritems()
+                if key not in ('stage', 'start', 'wall', 'thread'))
+            name = record['stage']
+            if record['layer'] is not None:
+                name += ' ' + record['layer']
+            events.append(dict(name=name, cat=record['stage'], ph='X', pid=1, tid=tid,
+                ts=int(record['start'] * 1e6), dur=int(record['wall'] * 1e6), args=args))
+        json.dump(dict(traceEvents=events, displayTimeUnit='ms'), outfile)
+
+    def _count(self, record, features):
+        record['features'] = len(features)
+        if self.vertices:
+            record['vertices'] = sum(count_vertices(f.geom) for f in features)
+
+    def _add(self, record):
+        # stages of different layers may run in several threads
+        with self._lock:
+            self.records.append(record)
+
+
+class _Measure(object):
+
+    def __init__(self, stats, stage, layer):
+        self.stats = stats
+        self.layer = layer
+        self.features = None
+        self.record = dict(stage=stage, layer=layer is not None and layer.id or None)
+
+    def count(self, features):
+        """ sets the features to count at the end of the stage """
+        self.features = features
+
+    def __enter__(self):
+        self._wall = time.time()
+        self._cpu = time.clock()
+        return self
+
+    def __exit__(self, type, value, tb):
+        wall = time.time() - self._wall
+        cpu = time.clock() - self._cpu
+        if type is not None:
+            return False
+        record = self.record
+        record['start'] = self._wall - self.stats._start
+        record['wall'] = wall
+        record['cpu'] = cpu
+        record['thread'] = threading.current_thread().name
+        features = self.features
+        if features is None and self.layer is not None:
+            features = self.layer.features
+        if features is not None:
+            self.stats._count(record, features)
+        self.stats._add(record)
+        return False
@@ -0,0 +1,66 @@
+"""
+benchmarks cropping the layers of world maps to the view, with the
+rectangle clipper and with the general intersection it replaced, and
+prints the best time of a few runs per layer
+
+    python crop.py [config ...]
+
+run it from the tests directory, without configs it uses worldmap.yaml
+and a map of Europe that crops most of the world away.
+"""
+from kartograph import Kartograph
+from kartograph.map import Map
+from kartograph.options import read_map_config
+from kartograph.stats import Stats
+import sys
+
+europe = {
+    'proj': {'id': 'laea', 'lon0': 10, 'lat0': 50},
+    'bounds': {'mode': 'bbox', 'data': [-10, 35, 30, 60]},
+    'layers': [{'id': 'countries', 'src': 'data/ne_50m_admin_0_countries.shp'}]
+}
+
+
+def crop_to_view_poly(self, layers):
+    """ the general intersection with the view polygon """
+    for layer in layers:
+        for feat in layer.features:
+            feat.crop_to(self.view_poly)
+
+
+def crop_times(cfg, crop, runs=5):
+    """ returns the crop-to-view records of a map, cropped by crop() """
+    Map._crop_layers_to_view = crop
+    best = None
+    for i in range(runs):
+        stats = Stats(vertices=True)
+        Kartograph().generate(cfg, outfile='crop-benchmark.svg', preview=False, stats=stats)
+        records = [r for r in stats.records if r['stage'] == 'crop-to-view']
+        if best is None:
+            best = records
+        else:
+            for b, r in zip(best, records):
+                b['wall'] = min(b['wall'], r['wall'])
+    return best
+
+
+def bench(name, cfg):
+    clip = Map._crop_layers_to_view
+    try:
+        before = crop_times(cfg, crop_to_view_poly)
+        after = crop_times(cfg, clip)
+    finally:
+        Map._crop_layers_to_view = clip
+    print name
+    print '  %-20s %-10s %-10s %-10s %s' % ('layer', 'features', 'vertices', 'secs', 'before')
+    for a, b in zip(after, before):
+        print '  %-20s %-10d %-10d %-10.3f %.3f' % (a['layer'], a['features'], a['vertices'], a['wall'], b['wall'])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            bench(path, read_map_config(open(path)))
+    else:
+        bench('configs/worldmap.yaml', read_map_config(open('configs/worldmap.yaml')))
+        bench('europe', europe)
@@ -0,0 +1,62 @@
+"""
+benchmarks joining features, e.g. counties into states
+
+    python join.py [config]
+
+without a config, a synthetic grid of 3000 "counties" is joined into
+50 "states". join-counties.json joins the US counties from the census
+cartographic boundary file cb_2018_us_county_20m by their state FIPS code.
+"""
+from kartograph import Kartograph
+from kartograph.geometry import create_feature
+from kartograph.geometry.utils import join_features
+from kartograph.options import read_map_config
+from shapely.geometry import Polygon
+import random
+import sys
+import time
+
+
+def random_counties(cols=60, rows=50):
+    """ returns a grid of cols * rows polygons with wiggly shared borders """
+    random.seed(1)
+    pts = {}
+    for i in range(cols + 1):
+        for j in range(rows + 1):
+            dx = 0 < i < cols and random.uniform(-0.3, 0.3) or 0
+            dy = 0 < j < rows and random.uniform(-0.3, 0.3) or 0
+            pts[(i, j)] = (i + dx, j + dy)
+    features = []
+    for i in range(cols):
+        for j in range(rows):
+            ring = [pts[(i, j)], pts[(i + 1, j)], pts[(i + 1, j + 1)], pts[(i, j + 1)]]
+            state = (i / 6) * 5 + j / 10
+            features.append(create_feature(Polygon(ring), {'state': state}))
+    return features
+
+
+def bench_synthetic():
+    features = random_counties()
+    states = {}
+    for feat in features:
+        states.setdefault(feat.props['state'], []).append(feat)
+    for buf in (False, 0.01):
+        t0 = time.time()
+        for state in states:
+            join_features(states[state], {'state': state}, buf=buf)
+        print 'joined %d counties into %d states (buffer=%s) in %.3f secs' % (
+            len(features), len(states), buf, time.time() - t0)
+
+
+def bench_config(path):
+    cfg = read_map_config(open(path))
+    t0 = time.time()
+    Kartograph().generate(cfg, outfile='join-benchmark.svg', preview=False)
+    print 'rendered %s in %.3f secs' % (path, time.time() - t0)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        bench_config(sys.argv[1])
+    else:
+        bench_synthetic()
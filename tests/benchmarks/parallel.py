@@ -0,0 +1,51 @@
+"""
+benchmarks parallel line simplification on synthetic lines
+using 1, 4 and 16 processes
+
+    python parallel.py [method] [tolerance] [lines] [vertices]
+"""
+from kartograph.simplify import create_point_store, unify_ring, simplify_jobs
+import math
+import random
+import sys
+import time
+
+
+def random_line(n, seed):
+    """ returns a wiggly river-like line with n vertices """
+    random.seed(seed)
+    pts = []
+    x = seed * 1000.0
+    y = 0
+    a = 0
+    for i in range(n):
+        a += random.uniform(-0.5, 0.5)
+        x += math.cos(a)
+        y += math.sin(a)
+        pts.append((x, y))
+    return pts
+
+
+def bench(method, tolerance, num_lines, num_vertices):
+    lines = [random_line(num_vertices, i) for i in range(num_lines)]
+    print '%-10s %-10s %-10s %s' % ('processes', 'kept', 'secs', 'speedup')
+    serial = None
+    for processes in (1, 4, 16):
+        store = create_point_store()
+        jobs = [([unify_ring(line, store)], method, tolerance, False) for line in lines]
+        t0 = time.time()
+        kept = 0
+        for out in simplify_jobs(jobs, store, processes):
+            kept += sum(1 for pt in out[0] if not store.deleted[pt])
+        elapsed = time.time() - t0
+        if serial is None:
+            serial = elapsed
+        print '%-10d %-10d %-10.3f %.2f' % (processes, kept, elapsed, serial / max(elapsed, 1e-9))
+
+
+if __name__ == '__main__':
+    method = len(sys.argv) > 1 and sys.argv[1] or 'visvalingam-whyatt'
+    tolerance = len(sys.argv) > 2 and float(sys.argv[2]) or 1.0
+    num_lines = len(sys.argv) > 3 and int(sys.argv[3]) or 1000
+    num_vertices = len(sys.argv) > 4 and int(sys.argv[4]) or 1000
+    bench(method, tolerance, num_lines, num_vertices)
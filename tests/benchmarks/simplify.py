@@ -0,0 +1,42 @@
+"""
+benchmarks the line simplification algorithms on synthetic
+lines with 1k to 1M vertices
+
+    python simplify.py [method] [tolerance]
+"""
+from kartograph.simplify import create_point_store, unify_ring, simplification_methods
+import math
+import random
+import sys
+import time
+
+
+def random_line(n):
+    """ returns a wiggly coastline-like line with n vertices """
+    random.seed(n)
+    pts = []
+    r = 0
+    for i in range(n):
+        a = 2 * math.pi * i / n
+        r = max(100, min(400, r + random.uniform(-2, 2) if r else 250))
+        pts.append((500 + r * math.cos(a), 500 + r * math.sin(a)))
+    return pts
+
+
+def bench(method, tolerance, sizes):
+    simplify = simplification_methods[method]
+    print '%-12s %-12s %-10s %s' % ('vertices', 'kept', 'secs', 'vertices/sec')
+    for n in sizes:
+        store = create_point_store()
+        line = unify_ring(random_line(n), store)
+        t0 = time.time()
+        simplify(line, store, tolerance)
+        elapsed = time.time() - t0
+        kept = len(line) - sum(store.deleted[pt] for pt in line)
+        print '%-12d %-12d %-10.3f %d' % (n, kept, elapsed, n / max(elapsed, 1e-9))
+
+
+if __name__ == '__main__':
+    method = len(sys.argv) > 1 and sys.argv[1] or 'visvalingam-whyatt'
+    tolerance = len(sys.argv) > 2 and float(sys.argv[2]) or 1.0
+    bench(method, tolerance, (1000, 10000, 100000, 1000000))
@@ -0,0 +1,42 @@
+"""
+benchmarks matching a choropleth stylesheet with dozens of
+attribute rules against thousands of features
+
+    python stylesheet.py [features] [rules]
+"""
+from kartograph.mapstyle import MapStyle
+import random
+import sys
+import time
+
+
+def choropleth(num_rules):
+    """ returns a stylesheet with one fill per class and a few size rules """
+    css = '#countries { stroke: #fff; fill: #ccc; }\n'
+    for i in range(num_rules):
+        css += '#countries[CLASS=c%d] { fill: #%06x; }\n' % (i, i * 997)
+    for i in range(10):
+        css += '#countries[POP>%d] { stroke-width: %dpx; }\n' % (i * 1000, i + 1)
+    return css
+
+
+def bench(num_features, num_rules):
+    random.seed(num_features)
+    features = [dict(CLASS='c%d' % random.randrange(num_rules), POP=random.randrange(10000),
+        NAME='feature %d' % i) for i in range(num_features)]
+    t0 = time.time()
+    style = MapStyle(choropleth(num_rules))
+    compiled = time.time() - t0
+    t0 = time.time()
+    for props in features:
+        style.getFeatureStyle('countries', [], props)
+    elapsed = time.time() - t0
+    print '%-10s %-10s %-12s %-10s %s' % ('features', 'rules', 'compile secs', 'secs', 'features/sec')
+    print '%-10d %-10d %-12.3f %-10.3f %d' % (num_features, num_rules, compiled, elapsed,
+        num_features / max(elapsed, 1e-9))
+
+
+if __name__ == '__main__':
+    num_features = len(sys.argv) > 1 and int(sys.argv[1]) or 10000
+    num_rules = len(sys.argv) > 2 and int(sys.argv[2]) or 50
+    bench(num_features, num_rules)
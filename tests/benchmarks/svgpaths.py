@@ -0,0 +1,62 @@
+"""
+benchmarks the construction of SVG path data for a layer of
+synthetic polygons and lines with 1M vertices in total
+
+    python svgpaths.py [round] [features] [vertices]
+"""
+from kartograph.renderer.svg import SvgRenderer, SvgDocument
+from kartograph.geometry import View
+from shapely.geometry import Polygon, LineString
+import math
+import random
+import sys
+import time
+
+
+class _Map(object):
+    """ the part of a map the renderer needs for rendering geometries """
+
+    def __init__(self, _round, mode):
+        self.options = {'export': {'round': _round,
+            'trim-zeros': mode == 'trim-zeros', 'relative-paths': mode == 'relative'}}
+        self.view = View(width=1000, height=1000)
+
+
+def random_ring(n, seed):
+    """ returns a ring of n vertices around a random center """
+    random.seed(seed)
+    cx, cy = random.uniform(0, 1000), random.uniform(0, 1000)
+    pts = []
+    for i in range(n):
+        a = 2 * math.pi * i / n
+        r = random.uniform(40, 50)
+        pts.append((cx + r * math.cos(a), cy + r * math.sin(a)))
+    return pts
+
+
+def bench(_round, num_features, num_vertices):
+    rings = [random_ring(num_vertices, i) for i in range(num_features)]
+    geometries = (
+        ('polygons', [Polygon(ring) for ring in rings]),
+        ('lines', [LineString(ring) for ring in rings]))
+    print '%-10s %-12s %-10s %-10s %s' % ('geometry', 'mode', 'MB', 'secs', 'vertices/sec')
+    for name, geoms in geometries:
+        for mode in ('absolute', 'trim-zeros', 'relative'):
+            renderer = SvgRenderer(_Map(_round, mode))
+            renderer.svg = SvgDocument()
+            render = name == 'lines' and renderer._render_line or renderer._render_polygon
+            t0 = time.time()
+            size = 0
+            for geom in geoms:
+                size += len(render(geom).getAttribute('d'))
+            elapsed = time.time() - t0
+            vertices = num_features * num_vertices
+            print '%-10s %-12s %-10.1f %-10.3f %d' % (name, mode, size / 1024.0 / 1024,
+                elapsed, vertices / max(elapsed, 1e-9))
+
+
+if __name__ == '__main__':
+    _round = len(sys.argv) > 1 and sys.argv[1] != 'false' and int(sys.argv[1]) or False
+    num_features = len(sys.argv) > 2 and int(sys.argv[2]) or 1000
+    num_vertices = len(sys.argv) > 3 and int(sys.argv[3]) or 1000
+    bench(_round, num_features, num_vertices)
@@ -0,0 +1,84 @@
+"""
+compares the time and peak memory needed to write an SVG with
+minidom (SvgDocument) and with the streaming writer (SvgStream),
+uncompressed and as svgz with compression levels 1, 6 and 9
+
+    python svgwriter.py [features] [vertices]
+"""
+from kartograph.renderer.svg import SvgDocument, SvgStream
+import gzip
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def random_path(n, seed):
+    """ returns the path data of a polygon with n vertices """
+    pts = []
+    for i in range(n):
+        a = 2 * math.pi * i / n
+        r = 50 + (i * 7919 + seed) % 13
+        pts.append('%.1f,%.1f' % (500 + r * math.cos(a), 500 + r * math.sin(a)))
+    return 'M' + 'L'.join(pts) + 'Z '
+
+
+def write(backend, num_features, num_vertices, outfile):
+    # The same paths are used over and over again, so the time and
+    # memory is spent on the document, not on the path data.
+    paths = [random_path(num_vertices, i) for i in range(100)]
+    t0 = time.time()
+    if backend == 'minidom':
+        svg = SvgDocument(width='1000px', height='1000px')
+    elif backend.startswith('svgz'):
+        level = int(backend.split('-')[1])
+        svg = SvgStream(gzip.GzipFile(outfile, 'wb', level), width='1000px', height='1000px')
+    else:
+        svg = SvgStream(outfile, width='1000px', height='1000px')
+    for l in range(10):
+        g = svg.node('g', svg.root, id='layer_%d' % l)
+        svg.open(g)
+        for i in range(num_features / 10):
+            path = svg.node('path', d=paths[i % 100])
+            path.setAttribute('data-id', str(i))
+            g.appendChild(path)
+        svg.flush()
+    if backend == 'minidom':
+        svg.write(outfile)
+    else:
+        svg.close()
+    return time.time() - t0
+
+
+def run(backend, num_features, num_vertices):
+    outfile = tempfile.NamedTemporaryFile(suffix='.svg', delete=False).name
+    elapsed = write(backend, num_features, num_vertices, outfile)
+    # ru_maxrss is in kilobytes on Linux
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    size = os.path.getsize(outfile) / 1024.0 / 1024
+    if backend.startswith('svgz'):
+        raw = len(gzip.open(outfile).read()) / 1024.0 / 1024
+    else:
+        raw = size
+    os.unlink(outfile)
+    print '%-10s %-10.1f %-10.3f %-10.1f %.1f' % (backend, size, elapsed, raw / elapsed, rss)
+
+
+def bench(num_features, num_vertices):
+    print '%-10s %-10s %-10s %-10s %s' % ('backend', 'size (MB)', 'secs', 'MB/sec', 'peak rss (MB)')
+    # Every backend runs in its own process to get its peak memory usage.
+    for backend in ('minidom', 'stream', 'svgz-1', 'svgz-6', 'svgz-9'):
+        subprocess.check_call([sys.executable, __file__, '--run', backend,
+            str(num_features), str(num_vertices)])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--run':
+        run(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+    else:
+        num_features = len(sys.argv) > 1 and int(sys.argv[1]) or 20000
+        num_vertices = len(sys.argv) > 2 and int(sys.argv[2]) or 200
+        bench(num_features, num_vertices)